@@ -0,0 +1,170 @@
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from account import models
+from core import metrics
+from core import terra
+
+# Keeps Asset ownership in sync with CW721 events on chain. Every Collection
+# records the last block applied to it (indexed_height) and when that happened
+# (indexed_at); a collection is bootstrapped from all_tokens/owner_of the first
+# time it is seen.
+
+OWNER_ATTRIBUTES = {
+    'mint': 'owner',
+    'transfer_nft': 'recipient',
+    'send_nft': 'recipient',
+}
+BURN_ACTIONS = ['burn']
+UNKNOWN_OWNER = object()
+
+def is_fresh(collection, tip):
+    """True if the collection is indexed to within MAX_LAG_BLOCKS of the chain ``tip``.
+
+    indexed_at is not enough: it moves with every block applied, even while the
+    indexer is far behind. With an unknown tip (chain unreachable) the index is
+    the best answer there is.
+    """
+    if collection.indexed_height is None:
+        return False
+    if tip is None:
+        return True
+    return tip - collection.indexed_height <= settings.INDEXER['MAX_LAG_BLOCKS']
+
+def _split_contract_attributes(attributes):
+    """Group a flat wasm attribute list into one dict per contract execution"""
+    groups = []
+    for attribute in attributes:
+        if attribute.get('key') == 'contract_address' or not groups:
+            groups.append({})
+        groups[-1].setdefault(attribute.get('key'), attribute.get('value'))
+    return groups
+
+def parse_nft_events(txs, contract_addrs):
+    """Yield (contract_addr, token_id, owner) for every ownership change in ``txs``.
+
+    owner is None for burns, and UNKNOWN_OWNER for mints that do not report
+    the owner (older cw721-base releases).
+    """
+    for tx in txs:
+        if tx.get('code'):
+            continue
+        for log in tx.get('logs') or []:
+            for event in log.get('events', []):
+                if event.get('type') not in ('wasm', 'from_contract'):
+                    continue
+                for attributes in _split_contract_attributes(event.get('attributes', [])):
+                    contract_addr = attributes.get('contract_address')
+                    action = attributes.get('action')
+                    token_id = attributes.get('token_id')
+                    if contract_addr not in contract_addrs or token_id is None:
+                        continue
+                    if action in OWNER_ATTRIBUTES:
+                        yield contract_addr, token_id, attributes.get(OWNER_ATTRIBUTES[action], UNKNOWN_OWNER)
+                    elif action in BURN_ACTIONS:
+                        yield contract_addr, token_id, None
+
+def apply_ownership(collection, owners):
+    """Make the assets of a collection match ``owners`` ({token_id: wallet_addr, or None if burned})"""
+    burned = [token_id for token_id, owner in owners.items() if owner is None]
+    owned = {token_id: owner for token_id, owner in owners.items() if owner is not None}
+
+    wallets = set(owned.values())
+    accounts = {account.wallet_addr: account for account in models.Account.objects.filter(wallet_addr__in=wallets)}
+    missing = wallets - accounts.keys()
+    if missing:
+        models.Account.objects.bulk_create(
+            [models.Account(username=wallet, wallet_addr=wallet) for wallet in missing],
+            ignore_conflicts=True
+        )
+        accounts.update({account.wallet_addr: account for account in models.Account.objects.filter(wallet_addr__in=missing)})
+
+    now = timezone.now()
+    assets = {asset.token_id: asset for asset in models.Asset.objects.filter(collection=collection, token_id__in=owned)}
+    changed = []
+    for token_id, asset in assets.items():
+        owner = accounts[owned[token_id]]
+        if asset.owner_id != owner.pk:
+            asset.owner = owner
+            asset.updated_at = now
+            changed.append(asset)
+    models.Asset.objects.bulk_update(changed, ['owner', 'updated_at'])
+    models.Asset.objects.bulk_create([
+        models.Asset(token_id=token_id, owner=accounts[owner], collection=collection)
+        for token_id, owner in owned.items() if token_id not in assets
+    ], ignore_conflicts=True)
+
+    if burned:
+        models.Asset.objects.filter(collection=collection, token_id__in=burned).delete()
+        models.NftInfo.objects.filter(collection=collection, token_id__in=burned).delete()
+
+def resolve_owners(contract_addr, owners):
+    """Replace UNKNOWN_OWNER values in ``owners`` with the current owner_of the token"""
+    unknown = [token_id for token_id, owner in owners.items() if owner is UNKNOWN_OWNER]
+    responses = terra.query_contract_many([
+        (contract_addr, { "owner_of":{ "token_id": token_id}}) for token_id in unknown
+    ])
+    owners.update({token_id: response['owner'] for token_id, response in zip(unknown, responses)})
+
+def bootstrap_collection(collection, height):
+    """Load the current owner of every token of a newly indexed collection"""
+    token_ids = [token_id for page in terra.iter_token_pages(collection.contract_addr) for token_id in page]
+
+    owners = {token_id: UNKNOWN_OWNER for token_id in token_ids}
+    resolve_owners(collection.contract_addr, owners)
+    burned = models.Asset.objects.filter(collection=collection).exclude(token_id__in=token_ids)
+    owners.update({token_id: None for token_id in burned.values_list('token_id', flat=True)})
+
+    with transaction.atomic():
+        apply_ownership(collection, owners)
+        collection.indexed_height = height
+        collection.indexed_at = timezone.now()
+        collection.save(update_fields=['indexed_height', 'indexed_at'])
+
+def index_block(height, txs, collections):
+    """Apply the ownership changes of one block to the collections not yet past it"""
+    contracts = {
+        collection.contract_addr: collection
+        for collection in collections if collection.indexed_height < height
+    }
+    changes = {}
+    for contract_addr, token_id, owner in parse_nft_events(txs, contracts):
+        changes.setdefault(contract_addr, {})[token_id] = owner
+    for contract_addr, owners in changes.items():
+        resolve_owners(contract_addr, owners)
+
+    with transaction.atomic():
+        for contract_addr, owners in changes.items():
+            apply_ownership(contracts[contract_addr], owners)
+        now = timezone.now()
+        for collection in contracts.values():
+            collection.indexed_height = height
+            collection.indexed_at = now
+        models.Collection.objects.bulk_update(contracts.values(), ['indexed_height', 'indexed_at'])
+
+    metrics.incr('indexer.blocks')
+    metrics.incr('indexer.events', sum(len(owners) for owners in changes.values()))
+
+def run_once():
+    """Index every collection up to the latest block. Returns the latest height."""
+    tip = int(terra.get_latest_block_height())
+    collections = list(models.Collection.objects.all())
+    for collection in collections:
+        if collection.indexed_height is None:
+            bootstrap_collection(collection, tip)
+    if not collections:
+        return tip
+
+    height = min(collection.indexed_height for collection in collections) + 1
+    metrics.gauge('indexer.lag_blocks', tip - height + 1)
+    while height <= tip:
+        heights = list(range(height, min(height + settings.INDEXER['WINDOW'], tip + 1)))
+        for block_height, txs in zip(heights, terra.get_block_txs_many(heights)):
+            index_block(block_height, txs, collections)
+        height = heights[-1] + 1
+
+    # Nothing new to apply still means the collections are current
+    models.Collection.objects.filter(indexed_height__gte=tip).update(indexed_at=timezone.now())
+    metrics.gauge('indexer.height', tip)
+    return tip
@@ -0,0 +1,73 @@
+from functools import reduce
+from operator import or_
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+
+from account import indexer
+from account import models
+
+# Set-based creation of sales orders, used by the bulk listing endpoint. The
+# collections, owners and assets of all orders are upserted with a handful of
+# queries instead of a few round trips per order.
+
+def _upsert_collections(contract_addrs):
+    models.Collection.objects.bulk_create(
+        [models.Collection(contract_addr=contract_addr) for contract_addr in contract_addrs],
+        ignore_conflicts=True
+    )
+    return {collection.contract_addr: collection for collection in models.Collection.objects.filter(contract_addr__in=contract_addrs)}
+
+def _load_assets(collections, orders):
+    token_ids = {}
+    for order in orders.values():
+        token_ids.setdefault(collections[order['collection']].pk, []).append(order['token_id'])
+    return {
+        (asset.collection.contract_addr, asset.token_id): asset
+        for asset in models.Asset.objects.filter(reduce(or_, [
+            Q(collection_id=collection_id, token_id__in=ids) for collection_id, ids in token_ids.items()
+        ])).select_related('collection')
+    }
+
+def create_sales_orders(orders):
+    """Insert sales orders for verified tokens in one transaction.
+
+    ``orders`` maps an item index to a dict with collection, token_id, owner
+    (the wallet verified on chain), price, signed_message and message.
+    Returns ({index: SalesOrder}, {index: error message}); orders for assets
+    that are already listed are reported as errors and not inserted.
+    """
+    created = {}
+    errors = {}
+    if not orders:
+        return created, errors
+
+    with transaction.atomic():
+        collections = _upsert_collections({order['collection'] for order in orders.values()})
+        owners = {}
+        for order in orders.values():
+            owners.setdefault(order['collection'], {})[order['token_id']] = order['owner']
+        for contract_addr, tokens in owners.items():
+            indexer.apply_ownership(collections[contract_addr], tokens)
+
+        assets = _load_assets(collections, orders)
+        listed = set(models.SalesOrder.objects.filter(asset__in=assets.values()).values_list('asset_id', flat=True))
+        for index, order in orders.items():
+            asset = assets[(order['collection'], order['token_id'])]
+            if asset.pk in listed:
+                errors[index] = 'The asset has already been listed for sale.'
+                continue
+            created[index] = models.SalesOrder(
+                asset=asset,
+                price=order['price'],
+                signed_message=order['signed_message'],
+                message=order['message'],
+            )
+        try:
+            with transaction.atomic():
+                models.SalesOrder.objects.bulk_create(created.values())
+        except IntegrityError:
+            # Another request listed one of the assets since the check above
+            errors.update({index: 'An asset of the request was listed concurrently, please retry.' for index in created})
+            created = {}
+    return created, errors
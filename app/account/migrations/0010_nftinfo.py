@@ -0,0 +1,33 @@
+# Generated by Django 3.2.7 on 2026-10-18 15:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0009_asset_unique_asset'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NftInfo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True, null=True)),
+                ('token_id', models.CharField(max_length=155)),
+                ('info', models.JSONField()),
+                ('block_height', models.BigIntegerField()),
+                ('collection', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='account.collection')),
+            ],
+            options={
+                'ordering': ['-created_at', '-updated_at'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='nftinfo',
+            constraint=models.UniqueConstraint(fields=('collection', 'token_id'), name='unique_nft_info'),
+        ),
+    ]
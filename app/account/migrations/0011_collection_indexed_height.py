@@ -0,0 +1,23 @@
+# Generated by Django 3.2.7 on 2026-10-18 15:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0010_nftinfo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='collection',
+            name='indexed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='collection',
+            name='indexed_height',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 3.2.7 on 2026-10-18 15:54
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0011_collection_indexed_height'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingTransaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True, null=True)),
+                ('tx_hash', models.CharField(max_length=155, unique=True)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('CONFIRMED', 'Confirmed'), ('FAILED', 'Failed'), ('EXPIRED', 'Expired')], default='PENDING', max_length=30)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('block_height', models.BigIntegerField(blank=True, null=True)),
+                ('error', models.CharField(blank=True, max_length=255)),
+                ('sales_order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='account.salesorder')),
+            ],
+            options={
+                'ordering': ['-created_at', '-updated_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='pendingtransaction',
+            index=models.Index(fields=['status', 'next_attempt_at'], name='pending_tx_due'),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from core.models import BaseInfo
 
 
@@ -16,6 +17,8 @@ class Account(BaseInfo):
 
 class Collection(BaseInfo):
     contract_addr = models.CharField(max_length=155, unique=True)
+    indexed_height = models.BigIntegerField(null=True, blank=True) #Last block applied by the chain indexer
+    indexed_at = models.DateTimeField(null=True, blank=True)
     
     def __str__(self):
         return self.contract_addr
@@ -39,6 +42,23 @@ class Asset(BaseInfo):
         ]
 
 
+class NftInfo(BaseInfo):
+    """Snapshot of a token's on-chain nft_info, taken at block_height"""
+    collection = models.ForeignKey("Collection", on_delete=models.CASCADE)
+    token_id = models.CharField(max_length=155)
+    info = models.JSONField()
+    block_height = models.BigIntegerField()
+
+    def __str__(self):
+        return self.token_id + ' ' + self.collection.contract_addr
+
+    class Meta:
+        ordering = ['-created_at', '-updated_at']
+        constraints = [
+            models.UniqueConstraint(fields=['collection', 'token_id'], name='unique_nft_info'),
+        ]
+
+
 class AssetProperties(BaseInfo):
     class DataType(models.TextChoices):
         NUMBER = 'NUMBER'
@@ -75,3 +95,28 @@ class SalesOrder(BaseInfo):
       
     class Meta:
         ordering = ['-created_at', '-updated_at']
+
+
+class PendingTransaction(BaseInfo):
+    """A transaction hash reported by a client, confirmed on chain by the tx verifier"""
+    class Status(models.TextChoices):
+        PENDING = 'PENDING'
+        CONFIRMED = 'CONFIRMED'
+        FAILED = 'FAILED'
+        EXPIRED = 'EXPIRED'
+    tx_hash = models.CharField(max_length=155, unique=True)
+    sales_order = models.ForeignKey("SalesOrder", on_delete=models.SET_NULL, null=True, blank=True) #Order the transaction fills
+    status = models.CharField(max_length=30, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    block_height = models.BigIntegerField(null=True, blank=True)
+    error = models.CharField(max_length=255, blank=True)
+
+    def __str__(self):
+        return self.tx_hash + ' ' + self.status
+
+    class Meta:
+        ordering = ['-created_at', '-updated_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='pending_tx_due'),
+        ]
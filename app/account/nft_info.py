@@ -0,0 +1,125 @@
+from functools import reduce
+from operator import or_
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework import serializers
+
+from account import models
+from core import chain_cache
+from core import metrics
+from core import terra
+
+# Token metadata is served from NftInfo snapshots. A snapshot is refreshed from
+# the chain once it is more than NFT_INFO['MAX_AGE_BLOCKS'] blocks old. Refreshes
+# bypass the chain cache, so that a snapshot is never older than its height.
+
+def get_block_height():
+    """Latest block height, cached for NFT_INFO['HEIGHT_TTL'] seconds. None if the chain is unreachable."""
+    cache = chain_cache.get_cache()
+    height = cache.get('latest_block_height')
+    if height is None:
+        try:
+            height = int(terra.get_latest_block_height())
+        except serializers.ValidationError:
+            return None
+        cache.set('latest_block_height', height, settings.NFT_INFO['HEIGHT_TTL'])
+    return height
+
+async def aget_block_height():
+    cache = chain_cache.get_cache()
+    height = await sync_to_async(cache.get)('latest_block_height')
+    if height is None:
+        try:
+            height = int(await terra.get_latest_block_height.run_async())
+        except serializers.ValidationError:
+            return None
+        await sync_to_async(cache.set)('latest_block_height', height, settings.NFT_INFO['HEIGHT_TTL'])
+    return height
+
+def get_nft_info(collection, token_id):
+    response = get_nft_info_many([(collection, token_id)])[(collection.pk, token_id)]
+    if isinstance(response, Exception):
+        raise response
+    return response
+
+def _load_snapshots(tokens):
+    token_ids = {}
+    for collection_id, token_id in tokens:
+        token_ids.setdefault(collection_id, []).append(token_id)
+    return {
+        (snapshot.collection_id, snapshot.token_id): snapshot
+        for snapshot in models.NftInfo.objects.filter(reduce(or_, [
+            Q(collection_id=collection_id, token_id__in=ids) for collection_id, ids in token_ids.items()
+        ]))
+    }
+
+def _stale_queries(tokens, snapshots, height):
+    max_age = settings.NFT_INFO['MAX_AGE_BLOCKS']
+    stale = [
+        key for key in tokens
+        if key not in snapshots or (height is not None and height - snapshots[key].block_height > max_age)
+    ]
+    metrics.incr('nft_info.snapshot_hits', len(tokens) - len(stale))
+    metrics.incr('nft_info.refreshes', len(stale))
+    return stale, [
+        (tokens[key][0].contract_addr, { "nft_info":{ "token_id": tokens[key][1]}}) for key in stale
+    ]
+
+def _save_snapshots(tokens, snapshots, height, stale, responses):
+    created = []
+    updated = []
+    now = timezone.now()
+    for key, response in zip(stale, responses):
+        if isinstance(response, Exception):
+            continue
+        snapshot = snapshots.get(key)
+        if snapshot is None:
+            snapshot = models.NftInfo(collection=tokens[key][0], token_id=key[1])
+            snapshots[key] = snapshot
+            created.append(snapshot)
+        else:
+            updated.append(snapshot)
+        snapshot.info = response
+        snapshot.block_height = height or snapshot.block_height or 0
+        snapshot.updated_at = now
+
+    models.NftInfo.objects.bulk_create(created, ignore_conflicts=True)
+    models.NftInfo.objects.bulk_update(updated, ['info', 'block_height', 'updated_at'])
+
+    results = {key: snapshots[key].info for key in tokens if key in snapshots}
+    for key, response in zip(stale, responses):
+        if key not in results:
+            results[key] = response
+    return results
+
+def get_nft_info_many(tokens):
+    """Return the nft_info of (collection, token_id) pairs keyed by (collection.pk, token_id).
+
+    Missing or stale snapshots are refreshed with one concurrent batch of
+    chain queries. If a refresh fails the stale snapshot is served instead;
+    tokens without any snapshot map to the ValidationError.
+    """
+    tokens = {(collection.pk, token_id): (collection, token_id) for collection, token_id in tokens}
+    if not tokens:
+        return {}
+
+    snapshots = _load_snapshots(tokens)
+    height = get_block_height()
+    stale, queries = _stale_queries(tokens, snapshots, height)
+    responses = terra.query_contract_many(queries, return_exceptions=True, cache=False) if queries else []
+    return _save_snapshots(tokens, snapshots, height, stale, responses)
+
+async def aget_nft_info_many(tokens):
+    """Async get_nft_info_many: awaits the chain and runs the database work in a thread"""
+    tokens = {(collection.pk, token_id): (collection, token_id) for collection, token_id in tokens}
+    if not tokens:
+        return {}
+
+    snapshots = await sync_to_async(_load_snapshots)(tokens)
+    height = await aget_block_height()
+    stale, queries = _stale_queries(tokens, snapshots, height)
+    responses = await terra.query_contract_many.run_async(queries, return_exceptions=True, cache=False) if queries else []
+    return await sync_to_async(_save_snapshots)(tokens, snapshots, height, stale, responses)
@@ -0,0 +1,88 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework import serializers
+
+from core import chain_cache
+from core import metrics
+from core import terra
+
+# Ownership checks for listings. owner_of results are cached for
+# OWNERSHIP['TTL'] seconds under the block height they were read at, so an
+# owner read before a new block is never served after it. The height is asked
+# from the chain on every check (one query for the whole batch), not taken
+# from the short-lived height cache of nft_info, which can lag a block behind.
+# Failed queries are not cached.
+
+def _key(height, contract_addr, token_id):
+    return f'owner_of:{height}:{contract_addr}:{token_id}'
+
+def _block_height():
+    try:
+        return int(terra.get_latest_block_height())
+    except serializers.ValidationError:
+        return None
+
+async def _ablock_height():
+    try:
+        return int(await terra.get_latest_block_height.run_async())
+    except serializers.ValidationError:
+        return None
+
+def _owner_queries(tokens):
+    return [(contract_addr, { "owner_of":{ "token_id": token_id}}) for contract_addr, token_id in tokens]
+
+def _load_owners(tokens, height):
+    if height is None:
+        return {}
+    cached = chain_cache.get_cache().get_many([_key(height, *token) for token in tokens])
+    owners = {token: cached[_key(height, *token)] for token in tokens if _key(height, *token) in cached}
+    metrics.incr('ownership.cache_hits', len(owners))
+    metrics.incr('ownership.queries', len(tokens) - len(owners))
+    return owners
+
+def _save_owners(owners, height, missing, responses):
+    verified = {}
+    for token, response in zip(missing, responses):
+        if isinstance(response, Exception):
+            owners[token] = response
+        else:
+            owners[token] = verified[token] = response['owner']
+    if height is not None and verified:
+        chain_cache.get_cache().set_many(
+            {_key(height, *token): owner for token, owner in verified.items()},
+            settings.OWNERSHIP['TTL']
+        )
+    return owners
+
+def get_owners(tokens):
+    """Return the owner of (contract_addr, token_id) pairs keyed by the pair.
+
+    Owners missing from the cache are queried in one concurrent batch. Tokens
+    whose query failed map to the ValidationError.
+    """
+    tokens = list(dict.fromkeys((str(contract_addr), str(token_id)) for contract_addr, token_id in tokens))
+    if not tokens:
+        return {}
+
+    height = _block_height()
+    owners = _load_owners(tokens, height)
+    missing = [token for token in tokens if token not in owners]
+    responses = terra.query_contract_many(_owner_queries(missing), return_exceptions=True) if missing else []
+    return _save_owners(owners, height, missing, responses)
+
+async def aget_owners(tokens):
+    tokens = list(dict.fromkeys((str(contract_addr), str(token_id)) for contract_addr, token_id in tokens))
+    if not tokens:
+        return {}
+
+    height = await _ablock_height()
+    owners = await sync_to_async(_load_owners)(tokens, height)
+    missing = [token for token in tokens if token not in owners]
+    responses = await terra.query_contract_many.run_async(_owner_queries(missing), return_exceptions=True) if missing else []
+    return await sync_to_async(_save_owners)(owners, height, missing, responses)
+
+def get_owner(contract_addr, token_id):
+    owner = get_owners([(contract_addr, token_id)])[(str(contract_addr), str(token_id))]
+    if isinstance(owner, Exception):
+        raise owner
+    return owner
@@ -1,9 +1,123 @@
+from django.conf import settings
+from django.db.models import Manager
 from rest_framework import serializers, status, validators
 
+from account import listings
 from account import models
+from account import nft_info
+from account import ownership
 from core import utils
 from core import terra
 
+# Chain query batching
+class ChainInfoListSerializer(serializers.ListSerializer):
+    """Prefetches the chain data of every row before rendering"""
+    def to_representation(self, data):
+        rows = list(data.all() if isinstance(data, Manager) else data)
+        self.child.prefetch_chain_info(rows)
+        return super().to_representation(rows)
+
+    async def aprefetch_chain_info(self, rows):
+        await self.child.aprefetch_chain_info(rows)
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            self.child.prefetch_validation_info(data)
+        return super().to_internal_value(data)
+
+    async def aprefetch_validation_info(self):
+        if isinstance(self.initial_data, list):
+            await self.child.aprefetch_validation_info(self.initial_data)
+
+class ChainInfoMixin:
+    """Serves contract queries from prefetched results.
+
+    Rows are prefetched by ChainInfoListSerializer, or ahead of time by async
+    views through aprefetch_chain_info/aprefetch_validation_info so that
+    rendering and validation do not block on the chain.
+    """
+    def get_chain_queries(self, obj):
+        return []
+
+    def get_validation_queries(self, data):
+        return []
+
+    def get_validation_tokens(self, data):
+        """(contract_addr, token_id) pairs whose owner validate() checks"""
+        return []
+
+    def _missing_queries(self, queries):
+        chain_info = self.context.get('chain_info', {})
+        missing = {}
+        for contract_addr, query_msg in queries:
+            key = terra.query_key(contract_addr, query_msg)
+            if key not in chain_info:
+                missing[key] = (contract_addr, query_msg)
+        return missing
+
+    def _prefetch_queries(self, queries):
+        queries = self._missing_queries(queries)
+        if queries:
+            results = terra.query_contract_many(list(queries.values()), return_exceptions=True)
+            self.context.setdefault('chain_info', {}).update(zip(queries.keys(), results))
+
+    def prefetch_chain_info(self, rows):
+        """Run the chain queries of all rows in one concurrent batch"""
+        self._prefetch_queries([query for row in rows for query in self.get_chain_queries(row)])
+
+    async def _aprefetch_queries(self, queries):
+        queries = self._missing_queries(queries)
+        if queries:
+            results = await terra.query_contract_many.run_async(list(queries.values()), return_exceptions=True)
+            self.context.setdefault('chain_info', {}).update(zip(queries.keys(), results))
+
+    async def aprefetch_chain_info(self, rows):
+        await self._aprefetch_queries([query for row in rows for query in self.get_chain_queries(row)])
+
+    def _validation_requests(self, items):
+        queries = []
+        tokens = []
+        for data in items:
+            try:
+                queries.extend(self.get_validation_queries(data))
+                tokens.extend(self.get_validation_tokens(data))
+            except (KeyError, TypeError, AttributeError):
+                # Malformed input, left for is_valid() to report
+                continue
+        owners = self.context.get('owners', {})
+        return queries, [token for token in tokens if token not in owners]
+
+    def prefetch_validation_info(self, items):
+        """Run the chain queries and ownership checks of all items in one concurrent batch"""
+        queries, tokens = self._validation_requests(items)
+        self._prefetch_queries(queries)
+        if tokens:
+            self.context.setdefault('owners', {}).update(ownership.get_owners(tokens))
+
+    async def aprefetch_validation_info(self, items=None):
+        queries, tokens = self._validation_requests([self.initial_data] if items is None else items)
+        await self._aprefetch_queries(queries)
+        if tokens:
+            self.context.setdefault('owners', {}).update(await ownership.aget_owners(tokens))
+
+    def get_owner(self, contract_addr, token_id):
+        owners = self.context.get('owners', {})
+        key = (str(contract_addr), str(token_id))
+        if key in owners:
+            if isinstance(owners[key], Exception):
+                raise owners[key]
+            return owners[key]
+        return ownership.get_owner(contract_addr, token_id)
+
+    def query_contract(self, contract_addr, query_msg):
+        chain_info = self.context.get('chain_info', {})
+        key = terra.query_key(contract_addr, query_msg)
+        if key in chain_info:
+            if isinstance(chain_info[key], Exception):
+                raise chain_info[key]
+            return chain_info[key]
+        return terra.query_contract(contract_addr, query_msg)
+
 # Account and asset data serializers
 class AccountSerializer(serializers.ModelSerializer):
     username = serializers.CharField(required=False)
@@ -30,7 +144,7 @@ class AccountSerializer(serializers.ModelSerializer):
             'id': account.pk
         }
 
-class CollectionSerializer(serializers.ModelSerializer):
+class CollectionSerializer(ChainInfoMixin, serializers.ModelSerializer):
     """Serializer for collection objects"""
     contract_addr = serializers.CharField()
     contract_info = serializers.SerializerMethodField()
@@ -39,17 +153,24 @@ class CollectionSerializer(serializers.ModelSerializer):
         model = models.Collection
         fields = ['id', 'contract_addr', 'contract_info']
         read_only_fields = ['id', 'contract_info']
+        list_serializer_class = ChainInfoListSerializer
+
+    def get_chain_queries(self, obj):
+        return [(obj.contract_addr, { "contract_info":{}})]
 
     def get_contract_info(self, obj):
         if self.instance is not None:
-            contract_info = terra.query_contract(getattr(obj, "contract_addr"), { "contract_info":{}})
+            contract_info = self.query_contract(getattr(obj, "contract_addr"), { "contract_info":{}})
         else:
-            contract_info = terra.query_contract(obj, { "contract_info":{}})
+            contract_info = self.query_contract(obj, { "contract_info":{}})
         return contract_info
 
+    def get_validation_queries(self, data):
+        return [(data["contract_addr"].strip(), { "contract_info":{}})]
+
     def validate(self, data):
         try:
-            terra.query_contract(data["contract_addr"], { "contract_info":{}})
+            self.query_contract(data["contract_addr"], { "contract_info":{}})
         except:
             raise serializers.ValidationError('Failed to query contract information from the provided contract address.')
         return data
@@ -69,7 +190,7 @@ class CollectionSerializer(serializers.ModelSerializer):
             'id': collection.pk
         }
 
-class AssetSerializer(serializers.ModelSerializer):
+class AssetSerializer(ChainInfoMixin, serializers.ModelSerializer):
     """Serializer for account objects"""
     token_info = serializers.SerializerMethodField()
     collection = CollectionSerializer()
@@ -80,22 +201,54 @@ class AssetSerializer(serializers.ModelSerializer):
         model = models.Asset
         fields = ['id', 'token_id', 'owner', 'collection', 'token_info']
         read_only_fields = ['id', 'token_info', 'collection', 'owner']
+        list_serializer_class = ChainInfoListSerializer
+
+    def get_chain_queries(self, obj):
+        return self.fields['collection'].get_chain_queries(obj.collection)
+
+    def get_validation_tokens(self, data):
+        return [(data["collection"]["contract_addr"].strip(), data["token_id"].strip())]
+
+    def _missing_nft_info(self, rows):
+        prefetched = self.context.get('nft_info', {})
+        return [(row.collection, row.token_id) for row in rows if (row.collection_id, row.token_id) not in prefetched]
+
+    def prefetch_chain_info(self, rows):
+        self.context.setdefault('nft_info', {}).update(
+            nft_info.get_nft_info_many(self._missing_nft_info(rows))
+        )
+        super().prefetch_chain_info(rows)
+
+    async def aprefetch_chain_info(self, rows):
+        self.context.setdefault('nft_info', {}).update(
+            await nft_info.aget_nft_info_many(self._missing_nft_info(rows))
+        )
+        await super().aprefetch_chain_info(rows)
+
+    def get_nft_info(self, collection, token_id):
+        prefetched = self.context.get('nft_info', {})
+        key = (collection.pk, token_id)
+        if key in prefetched:
+            if isinstance(prefetched[key], Exception):
+                raise prefetched[key]
+            return prefetched[key]
+        return nft_info.get_nft_info(collection, token_id)
 
     def get_token_info(self, obj):
         if self.instance is not None:
-            token_info = terra.query_contract(getattr(obj, "collection").contract_addr, { "nft_info":{ "token_id": getattr(obj, "token_id")}})
+            token_info = self.get_nft_info(getattr(obj, "collection"), getattr(obj, "token_id"))
         else:
-            token_info = terra.query_contract(obj["collection"].contract_addr, { "nft_info":{ "token_id": obj["token_id"]}})
+            token_info = self.get_nft_info(obj["collection"], obj["token_id"])
         return token_info
 
     def validate(self, data):
         try:
-            owner_info = terra.query_contract(data["collection"].get('contract_addr'), { "owner_of":{ "token_id": data["token_id"]}})
+            owner_addr = self.get_owner(data["collection"].get('contract_addr'), data["token_id"])
         except:
             raise serializers.ValidationError('Failed to query token information from the provided contract address with the provided token ID.')
         
         owner, is_created = models.Account.objects.get_or_create(
-            wallet_addr=owner_info.get('owner')
+            wallet_addr=owner_addr
         )
         collection, is_created = models.Collection.objects.get_or_create(
             contract_addr=data['collection'].get('contract_addr')
@@ -150,7 +303,7 @@ class EmailSerializer(serializers.ModelSerializer):
             'id': prelaunchEmail.pk
         }
 
-class SalesOrderSerializer(serializers.ModelSerializer):
+class SalesOrderSerializer(ChainInfoMixin, serializers.ModelSerializer):
     """Serializer for Sales Order objects"""
     collection = serializers.CharField(write_only=True)
     token_id = serializers.CharField(write_only=True)
@@ -160,10 +313,14 @@ class SalesOrderSerializer(serializers.ModelSerializer):
         model = models.SalesOrder
         fields = ['id', 'collection', 'token_id', 'asset', 'price', 'signed_message', 'message']
         read_only_fields = ['id', 'asset']
+        list_serializer_class = ChainInfoListSerializer
+
+    def get_validation_tokens(self, data):
+        return [(data["collection"].strip(), data["token_id"].strip())]
 
     def validate(self, data):
         try:
-            owner_info = terra.query_contract(data["collection"], { "owner_of":{ "token_id": data["token_id"]}})
+            owner_addr = self.get_owner(data["collection"], data["token_id"])
         except:
             raise serializers.ValidationError('Failed to query token information from the provided contract address with the provided token ID.')
 
@@ -171,12 +328,13 @@ class SalesOrderSerializer(serializers.ModelSerializer):
             contract_addr=data['collection']
         )
         owner, is_created = models.Account.objects.get_or_create(
-            wallet_addr=owner_info.get('owner')
+            wallet_addr=owner_addr
         )
-        asset, is_created = models.Asset.objects.get_or_create(
+        # The chain is authoritative: a known asset that changed hands is moved to its owner
+        asset, is_created = models.Asset.objects.update_or_create(
             token_id=data['token_id'],
             collection=collection,
-            owner=owner
+            defaults={'owner': owner}
         )
         try:
             salesOrder = models.SalesOrder.objects.get(
@@ -201,4 +359,70 @@ class SalesOrderSerializer(serializers.ModelSerializer):
         return {
             'message': "Sales Order added.",
             'id': salesOrder.pk
-        }
\ No newline at end of file
+        }
+
+class SalesOrderBulkSerializer(ChainInfoMixin, serializers.Serializer):
+    """Serializer for listing many sales orders at once.
+
+    Orders that fail validation are reported by their index in ``orders``
+    while the others are still created.
+    """
+    orders = serializers.ListField(
+        allow_empty=False,
+        max_length=settings.SALES_ORDERS['BULK_MAX_ORDERS']
+    )
+
+    def get_validation_tokens(self, data):
+        return [
+            (str(order["collection"]).strip(), str(order["token_id"]).strip())
+            for order in data["orders"] if isinstance(order, dict) and "collection" in order and "token_id" in order
+        ]
+
+    def validate(self, data):
+        order_serializer = SalesOrderSerializer(context=self.context)
+        orders = {}
+        errors = {}
+        tokens = set()
+        for index, order in enumerate(data['orders']):
+            try:
+                order = order_serializer.to_internal_value(order)
+            except serializers.ValidationError as e:
+                errors[index] = e.detail
+                continue
+            token = (order['collection'], order['token_id'])
+            if token in tokens:
+                errors[index] = 'The asset is listed more than once in the request.'
+                continue
+            try:
+                order['owner'] = self.get_owner(*token)
+            except:
+                errors[index] = 'Failed to query token information from the provided contract address with the provided token ID.'
+                continue
+            tokens.add(token)
+            orders[index] = order
+
+        if not orders:
+            raise serializers.ValidationError({'orders': errors})
+        data['orders'] = orders
+        data['errors'] = errors
+        return data
+
+    def save(self):
+        created, errors = listings.create_sales_orders(self.validated_data['orders'])
+        errors.update(self.validated_data['errors'])
+
+        return {
+            'message': "Sales Orders added.",
+            'created': [
+                {'index': index, 'id': salesOrder.pk, 'token_id': salesOrder.asset.token_id}
+                for index, salesOrder in sorted(created.items())
+            ],
+            'errors': dict(sorted(errors.items())),
+        }
+
+class PendingTransactionSerializer(serializers.ModelSerializer):
+    """Serializer for transactions waiting for on-chain confirmation"""
+    class Meta:
+        model = models.PendingTransaction
+        fields = ['id', 'tx_hash', 'sales_order', 'status', 'attempts', 'block_height', 'error']
+        read_only_fields = ['id', 'status', 'attempts', 'block_height', 'error']
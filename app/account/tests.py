@@ -1,3 +1,246 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from account import indexer
+from account import models
+from account import nft_info
+from account import ownership
+from account import tx_verifier
+from core import chain_cache
+from core import lcd
+from core import terra
+
+COLLECTION = 'terra1coll'
+
+
+def nft_tx(tx_hash, action, token_id, code=0, **attributes):
+    """A tx search result executing one cw721 ``action`` on COLLECTION"""
+    attributes = dict({'contract_address': COLLECTION, 'action': action}, **attributes, token_id=token_id)
+    return {
+        'txhash': tx_hash,
+        'code': code,
+        'raw_log': 'out of gas' if code else '[]',
+        'gas_wanted': '1',
+        'gas_used': '1',
+        'timestamp': '2022-01-01T00:00:00Z',
+        'tx': {'type': 'core/StdTx', 'value': {'msg': [], 'fee': {'gas': '0', 'amount': []}, 'signatures': [], 'memo': ''}},
+        'logs': [{'msg_index': 0, 'log': '', 'events': [
+            {'type': 'from_contract', 'attributes': [{'key': key, 'value': value} for key, value in attributes.items()]},
+        ]}],
+    }
+
+
+FIXTURE = {
+    'blocks': [
+        {'height': 100, 'txs': []},
+        {'height': 101, 'txs': [nft_tx('SALE', 'transfer_nft', '1', sender='terra1alice', recipient='terra1bob')]},
+        {'height': 102, 'txs': [
+            nft_tx('BAD', 'burn', '2', code=5),
+            nft_tx('MINT', 'mint', '4', minter='terra1alice', owner='terra1carol'),
+        ]},
+        {'height': 103, 'txs': []},
+        {'height': 104, 'txs': [nft_tx('BURN', 'burn', '3', sender='terra1alice')]},
+        {'height': 105, 'txs': [nft_tx('RESALE', 'transfer_nft', '1', sender='terra1bob', recipient='terra1carol')]},
+    ],
+    'queries': [
+        {'contract_addr': COLLECTION, 'query_msg': {'nft_info': {'token_id': '1'}}, 'result': {'token_uri': 'ipfs://chain'}},
+        {'contract_addr': COLLECTION, 'query_msg': {'owner_of': {'token_id': '1'}}, 'result': {'owner': 'terra1carol'}},
+    ],
+}
+
+
+class FakeLCD:
+    """manage.py serve_fake_lcd on a free port, replaying ``fixture``"""
+
+    def __init__(self, fixture, block_time=0):
+        self.fixture = fixture
+        self.block_time = block_time
+
+    def __enter__(self):
+        self.dir = tempfile.mkdtemp()
+        path = os.path.join(self.dir, 'fixture.json')
+        with open(path, 'w') as f:
+            json.dump(self.fixture, f)
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            self.port = s.getsockname()[1]
+        self.url = 'http://127.0.0.1:%d' % self.port
+        self.process = subprocess.Popen(
+            [sys.executable, 'manage.py', 'serve_fake_lcd', path, '--port', str(self.port), '--block-time', str(self.block_time)],
+            cwd=settings.BASE_DIR, stdout=subprocess.DEVNULL
+        )
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', self.port), timeout=1).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline or self.process.poll() is not None:
+                    self.__exit__()
+                    raise RuntimeError('serve_fake_lcd did not start')
+                time.sleep(0.1)
+        return self
+
+    def __exit__(self, *args):
+        self.process.terminate()
+        self.process.wait()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+def use_lcd(testcase, *urls):
+    """Send the chain queries of ``testcase`` to ``urls`` through a fresh LCD client pool"""
+    pool = lcd.LCDClientPool()
+    testcase.addCleanup(pool.close)
+    for module in (lcd, terra):
+        patcher = mock.patch.object(module, 'pool', pool)
+        patcher.start()
+        testcase.addCleanup(patcher.stop)
+    config = override_settings(TERRA_LCD=dict(settings.TERRA_LCD, URLS=list(urls)))
+    config.enable()
+    testcase.addCleanup(config.disable)
+
+
+class ChainTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.lcd = FakeLCD(FIXTURE)
+        cls.lcd.__enter__()
+        cls.addClassCleanup(cls.lcd.__exit__)
+
+    def setUp(self):
+        use_lcd(self, self.lcd.url)
+        self.collection = models.Collection.objects.create(contract_addr=COLLECTION, indexed_height=100, indexed_at=timezone.now())
+        self.alice = models.Account.objects.create(username='alice', wallet_addr='terra1alice')
+        for token_id in ('1', '2', '3'):
+            models.Asset.objects.create(token_id=token_id, owner=self.alice, collection=self.collection)
+
+    def owners(self):
+        return dict(models.Asset.objects.filter(collection=self.collection).values_list('token_id', 'owner__wallet_addr'))
+
+
+@override_settings(INDEXER={'POLL_INTERVAL': 1, 'WINDOW': 2, 'MAX_LAG_BLOCKS': 2})
+class IndexerTests(ChainTestCase):
+
+    def test_catch_up_applies_every_block_in_order(self):
+        self.assertFalse(indexer.is_fresh(self.collection, 105))
+
+        self.assertEqual(indexer.run_once(), 105)
+
+        self.collection.refresh_from_db()
+        self.assertEqual(self.collection.indexed_height, 105)
+        self.assertTrue(indexer.is_fresh(self.collection, 105))
+        # 1 sold twice, 2 kept (its burn failed), 3 burned, 4 minted
+        self.assertEqual(self.owners(), {'1': 'terra1carol', '2': 'terra1alice', '4': 'terra1carol'})
+
+    def test_blocks_are_not_applied_twice(self):
+        indexer.run_once()
+        models.Asset.objects.filter(token_id='1').update(owner=self.alice)
+
+        self.assertEqual(indexer.run_once(), 105)
+        self.assertEqual(self.owners()['1'], 'terra1alice')
+
+
+class CachedChainTestCase(ChainTestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache = override_settings(CACHES=dict(settings.CACHES, chain={'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'account-tests'}))
+        cache.enable()
+        self.addCleanup(cache.disable)
+        self.addCleanup(chain_cache.get_cache().clear)
+
+
+@override_settings(NFT_INFO={'MAX_AGE_BLOCKS': 10, 'HEIGHT_TTL': 6})
+class NftInfoTests(CachedChainTestCase):
+    QUERY = {'nft_info': {'token_id': '1'}}
+
+    def test_refresh_stores_the_chain_value_not_the_cached_one(self):
+        models.NftInfo.objects.create(collection=self.collection, token_id='1', info={'token_uri': 'ipfs://old'}, block_height=90)
+        chain_cache.set(COLLECTION, self.QUERY, {'token_uri': 'ipfs://cached'})
+
+        info = nft_info.get_nft_info(self.collection, '1')
+
+        self.assertEqual(info, {'token_uri': 'ipfs://chain'})
+        snapshot = models.NftInfo.objects.get(collection=self.collection, token_id='1')
+        self.assertEqual((snapshot.info, snapshot.block_height), ({'token_uri': 'ipfs://chain'}, 105))
+
+    def test_recent_snapshots_are_served_without_a_query(self):
+        models.NftInfo.objects.create(collection=self.collection, token_id='1', info={'token_uri': 'ipfs://snapshot'}, block_height=100)
+
+        self.assertEqual(nft_info.get_nft_info(self.collection, '1'), {'token_uri': 'ipfs://snapshot'})
+
+
+class OwnershipTests(CachedChainTestCase):
+
+    def test_owners_cached_before_the_latest_block_are_not_served(self):
+        # The height cache of nft_info still says 104 while block 105 is out
+        cache = chain_cache.get_cache()
+        cache.set('latest_block_height', 104)
+        cache.set(f'owner_of:104:{COLLECTION}:1', 'terra1bob')
+
+        self.assertEqual(ownership.get_owner(COLLECTION, '1'), 'terra1carol')
+        self.assertEqual(async_to_sync(ownership.aget_owners)([(COLLECTION, '1')]), {(COLLECTION, '1'): 'terra1carol'})
+        self.assertEqual(cache.get(f'owner_of:105:{COLLECTION}:1'), 'terra1carol')
+
+
+@override_settings(TX_VERIFIER=dict(settings.TX_VERIFIER, LEASE_SECONDS=60))
+class TxVerifierLeaseTests(ChainTestCase):
+
+    def test_crashed_worker_lease_is_reclaimed(self):
+        pending_tx = models.PendingTransaction.objects.create(tx_hash='SALE')
+
+        # A worker leases the transaction and dies before looking it up
+        self.assertEqual(tx_verifier._claim(10), [pending_tx])
+        self.assertEqual(tx_verifier.run_once(), 0)
+
+        later = timezone.now() + timedelta(seconds=61)
+        with mock.patch.object(tx_verifier.timezone, 'now', return_value=later):
+            self.assertEqual(tx_verifier.run_once(), 1)
+
+        pending_tx.refresh_from_db()
+        self.assertEqual(pending_tx.status, models.PendingTransaction.Status.CONFIRMED)
+        self.assertEqual(pending_tx.block_height, 101)
+        self.assertEqual(self.owners()['1'], 'terra1bob')
+
+    def test_failed_and_unknown_transactions(self):
+        bad = models.PendingTransaction.objects.create(tx_hash='BAD')
+        unknown = models.PendingTransaction.objects.create(tx_hash='UNKNOWN')
+
+        self.assertEqual(tx_verifier.run_once(), 2)
+
+        bad.refresh_from_db()
+        unknown.refresh_from_db()
+        self.assertEqual((bad.status, bad.error), (models.PendingTransaction.Status.FAILED, 'out of gas'))
+        self.assertEqual((unknown.status, unknown.attempts), (models.PendingTransaction.Status.PENDING, 1))
+        self.assertGreater(unknown.next_attempt_at, timezone.now())
+
+
+@override_settings(INDEXER={'POLL_INTERVAL': 1, 'WINDOW': 20, 'MAX_LAG_BLOCKS': 10})
+class IsFreshTests(SimpleTestCase):
+
+    def test_lag_is_measured_in_blocks(self):
+        # Applied a block just now, but 50 blocks behind the chain
+        collection = models.Collection(contract_addr='terra1a', indexed_height=1000, indexed_at=timezone.now())
+        self.assertTrue(indexer.is_fresh(collection, 1000))
+        self.assertTrue(indexer.is_fresh(collection, 1010))
+        self.assertFalse(indexer.is_fresh(collection, 1011))
+        self.assertFalse(indexer.is_fresh(collection, 1050))
+
+    def test_unindexed_and_unknown_tip(self):
+        self.assertFalse(indexer.is_fresh(models.Collection(contract_addr='terra1a'), 1000))
+        self.assertTrue(indexer.is_fresh(models.Collection(contract_addr='terra1a', indexed_height=1000), None))
@@ -0,0 +1,128 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework import serializers
+
+from account import indexer
+from account import models
+from core import metrics
+from core import terra
+
+# Confirms client-reported transaction hashes on chain. Due PendingTransaction
+# rows are claimed in batches (with SKIP LOCKED, so several workers can run
+# side by side), looked up concurrently, and the ownership changes of the
+# confirmed ones are applied to Asset and SalesOrder rows.
+
+Status = models.PendingTransaction.Status
+
+def _claim(batch_size):
+    """Lease up to ``batch_size`` due transactions to this worker"""
+    now = timezone.now()
+    with transaction.atomic():
+        pending = list(
+            models.PendingTransaction.objects.select_for_update(skip_locked=True)
+            .filter(status=Status.PENDING, next_attempt_at__lte=now)
+            .select_related('sales_order')
+            .order_by('next_attempt_at')[:batch_size]
+        )
+        models.PendingTransaction.objects.filter(pk__in=[pending_tx.pk for pending_tx in pending]).update(
+            next_attempt_at=now + timedelta(seconds=settings.TX_VERIFIER['LEASE_SECONDS'])
+        )
+    return pending
+
+def _contract_addrs(tx_info):
+    return {
+        attribute.get('value')
+        for log in tx_info.get('logs') or []
+        for event in log.get('events', [])
+        for attribute in event.get('attributes', [])
+        if attribute.get('key') == 'contract_address'
+    }
+
+def _retry(pending_tx, error):
+    config = settings.TX_VERIFIER
+    pending_tx.attempts += 1
+    pending_tx.error = error[:255]
+    if pending_tx.attempts >= config['MAX_ATTEMPTS']:
+        pending_tx.status = Status.EXPIRED
+        metrics.incr('tx_verifier.expired')
+    else:
+        delay = min(config['BACKOFF_BASE'] ** pending_tx.attempts, config['BACKOFF_MAX'])
+        pending_tx.next_attempt_at = timezone.now() + timedelta(seconds=delay)
+        metrics.incr('tx_verifier.retries')
+    pending_tx.save(update_fields=['attempts', 'error', 'status', 'next_attempt_at', 'updated_at'])
+
+def _confirm(pending_tx, tx_info):
+    """Apply the ownership changes of a successful transaction"""
+    collections = {
+        collection.contract_addr: collection
+        for collection in models.Collection.objects.filter(contract_addr__in=_contract_addrs(tx_info))
+    }
+    changes = {}
+    for contract_addr, token_id, owner in indexer.parse_nft_events([tx_info], collections):
+        changes.setdefault(contract_addr, {})[token_id] = owner
+    for contract_addr, owners in changes.items():
+        indexer.resolve_owners(contract_addr, owners)
+
+    sales_order = pending_tx.sales_order
+    if sales_order is not None:
+        asset = sales_order.asset
+        if asset.token_id not in changes.get(asset.collection.contract_addr, {}):
+            pending_tx.status = Status.FAILED
+            pending_tx.error = 'The transaction does not transfer the listed asset.'
+            pending_tx.save(update_fields=['status', 'error', 'updated_at'])
+            metrics.incr('tx_verifier.failed')
+            return
+
+    height = int(tx_info['height'])
+    executed_at = parse_datetime(tx_info.get('timestamp') or '')
+    with transaction.atomic():
+        for contract_addr, owners in changes.items():
+            collection = collections[contract_addr]
+            # The indexer already applied this block, and possibly newer ones
+            if collection.indexed_height is None or collection.indexed_height < height:
+                indexer.apply_ownership(collection, owners)
+            # Assets that changed hands can no longer be sold by their former owner
+            orders = models.SalesOrder.objects.filter(asset__collection=collection, asset__token_id__in=owners)
+            if executed_at is not None:
+                orders = orders.filter(created_at__lte=executed_at)
+            orders.delete()
+        pending_tx.status = Status.CONFIRMED
+        pending_tx.block_height = height
+        pending_tx.error = ''
+        pending_tx.save(update_fields=['status', 'block_height', 'error', 'updated_at'])
+
+    metrics.incr('tx_verifier.confirmed')
+    metrics.observe('tx_verifier.latency_seconds', (timezone.now() - pending_tx.created_at).total_seconds())
+
+def run_once(batch_size=None):
+    """Verify one batch of due transactions. Returns the number of transactions looked up."""
+    pending = _claim(batch_size or settings.TX_VERIFIER['BATCH_SIZE'])
+    responses = terra.get_tx_info_many([pending_tx.tx_hash for pending_tx in pending], return_exceptions=True) if pending else []
+    found = []
+    for pending_tx, tx_info in zip(pending, responses):
+        if isinstance(tx_info, Exception):
+            _retry(pending_tx, str(tx_info))
+        elif tx_info is None:
+            _retry(pending_tx, 'Transaction not found.')
+        elif tx_info.get('code'):
+            pending_tx.status = Status.FAILED
+            pending_tx.block_height = int(tx_info['height'])
+            pending_tx.error = (tx_info.get('raw_log') or 'Transaction failed.')[:255]
+            pending_tx.save(update_fields=['status', 'block_height', 'error', 'updated_at'])
+            metrics.incr('tx_verifier.failed')
+        else:
+            found.append((pending_tx, tx_info))
+
+    # Oldest first, so that a later transfer of the same token wins
+    for pending_tx, tx_info in sorted(found, key=lambda item: int(item[1]['height'])):
+        try:
+            _confirm(pending_tx, tx_info)
+        except serializers.ValidationError as e:
+            _retry(pending_tx, str(e))
+
+    metrics.gauge('tx_verifier.queue_depth', models.PendingTransaction.objects.filter(status=Status.PENDING).count())
+    return len(pending)
@@ -10,6 +10,7 @@ router.register(r'accounts', views.AccountViewset)
 router.register(r'assets', views.AssetViewset)
 router.register(r'sales', views.SalesOrderViewset)
 router.register(r'emails', views.EmailViewset)
+router.register(r'transactions', views.TransactionViewset)
 
 urlpatterns = [
   url(r'', include(router.urls)),
@@ -1,14 +1,20 @@
+from asgiref.sync import sync_to_async
 from django.shortcuts import render
+from django.conf import settings
 from rest_framework import status, generics, viewsets, mixins
+from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
 
 from drf_yasg.utils import swagger_auto_schema
 
+from account import indexer
 from account import models
+from account import nft_info
 from account import serializers
 from core import utils
 from core import terra
+from core.views import AsyncDispatchMixin
 
 #TODO: Define permissions for create and update actions
 
@@ -36,7 +42,34 @@ class BaseViewSet(viewsets.GenericViewSet,
   def update(self, request, *args, **kwargs):
     return Response(status=status.HTTP_403_FORBIDDEN)
 
-class CollectionViewSet(BaseViewSet):
+class AsyncChainMixin(AsyncDispatchMixin):
+    """Async list, retrieve and create for serializers using ChainInfoMixin.
+
+    Chain queries are prefetched on the event loop before the (sync) database
+    and serializer work, so a request waiting on the LCD holds no thread.
+    """
+
+    async def list(self, request, *args, **kwargs):
+        rows = await sync_to_async(lambda: list(self.filter_queryset(self.get_queryset())))()
+        serializer = self.get_serializer(rows, many=True)
+        await serializer.aprefetch_chain_info(rows)
+        return Response(await sync_to_async(lambda: serializer.data)())
+
+    async def retrieve(self, request, *args, **kwargs):
+        instance = await sync_to_async(self.get_object)()
+        serializer = self.get_serializer(instance)
+        await serializer.aprefetch_chain_info([instance])
+        return Response(await sync_to_async(lambda: serializer.data)())
+
+    async def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        await serializer.aprefetch_validation_info()
+        await sync_to_async(serializer.is_valid)(raise_exception=True)
+        await sync_to_async(self.perform_create)(serializer)
+        data = await sync_to_async(lambda: serializer.data)()
+        return Response(data, status=status.HTTP_201_CREATED, headers=self.get_success_headers(data))
+
+class CollectionViewSet(AsyncChainMixin, BaseViewSet):
     """Manage collections in the database"""
     queryset = models.Collection.objects.all()
     serializer_class = serializers.CollectionSerializer
@@ -80,12 +113,12 @@ class AccountViewset(BaseViewSet):
             return Response(content, status=status.HTTP_400_BAD_REQUEST)
 
 
-class AssetViewset(viewsets.GenericViewSet, 
+class AssetViewset(AsyncChainMixin, viewsets.GenericViewSet, 
     mixins.ListModelMixin,
     mixins.CreateModelMixin,
     mixins.RetrieveModelMixin):
     """Manage assets in the database"""
-    queryset = models.Asset.objects.all()
+    queryset = models.Asset.objects.select_related('owner', 'collection')
     serializer_class = serializers.AssetSerializer
     permission_classes = [AllowAny]
 
@@ -121,33 +154,54 @@ class AssetViewset(viewsets.GenericViewSet,
             return Response(content, status=status.HTTP_400_BAD_REQUEST)
     '''
 
-class AccountAssetView(generics.GenericAPIView):
+class AccountAssetView(AsyncDispatchMixin, generics.GenericAPIView):
     queryset = models.Asset.objects.all()
     permission_classes = [AllowAny]
     serializer_class = serializers.AssetSerializer
 
-    def get(self, request, wallet=None, contract=None):
-        account, is_created = models.Account.objects.get_or_create(
+    async def get(self, request, wallet=None, contract=None):
+        try:
+            limit = min(int(request.query_params.get('limit', settings.ACCOUNT_ASSETS['PAGE_SIZE'])), settings.ACCOUNT_ASSETS['MAX_PAGE_SIZE'])
+        except ValueError:
+            return Response({'limit': 'A valid integer is required.'}, status=status.HTTP_400_BAD_REQUEST)
+        cursor = request.query_params.get('cursor')
+
+        account, is_created = await sync_to_async(models.Account.objects.get_or_create)(
             wallet_addr=wallet
         )
-        collection, is_created = models.Collection.objects.get_or_create(
+        collection, is_created = await sync_to_async(models.Collection.objects.get_or_create)(
             contract_addr=contract
         )
 
-        response = terra.query_contract(contract, { "tokens": { "owner": wallet }})
-        assets = models.Asset.objects.none()
-        for token in response['tokens']:
-            asset, is_created = models.Asset.objects.get_or_create(
-                token_id = token,
-                owner = account,
-                collection = collection,
-            )
-            assets = assets.union(models.Asset.objects.filter(pk=asset.pk))
+        if indexer.is_fresh(collection, await nft_info.aget_block_height()):
+            assets = models.Asset.objects.filter(owner=account, collection=collection).select_related('owner', 'collection').order_by('token_id')
+            if cursor is not None:
+                assets = assets.filter(token_id__gt=cursor)
+            assets = await sync_to_async(list)(assets[:limit])
+            serializer = self.serializer_class(assets, many=True)
+            await serializer.aprefetch_chain_info(assets)
+            response = Response(await sync_to_async(lambda: serializer.data)(), status=status.HTTP_200_OK)
+            response['X-Indexed-Height'] = collection.indexed_height
+            if len(assets) == limit:
+                response['X-Next-Cursor'] = assets[-1].token_id
+            return response
+
+        token_ids = []
+        async for page in terra.aiter_token_pages(contract, owner=wallet, start_after=cursor, max_tokens=limit):
+            await sync_to_async(indexer.apply_ownership)(collection, {token: account.wallet_addr for token in page})
+            token_ids.extend(page)
+        assets = await sync_to_async(list)(
+            models.Asset.objects.filter(collection=collection, token_id__in=token_ids).select_related('owner', 'collection').order_by('token_id')
+        )
         serializer = self.serializer_class(assets, many=True)
+        await serializer.aprefetch_chain_info(assets)
         #user = User.objects.get(username=request.user)
         #queryset = models.UserAddress.objects.filter(user=user)
         #serializer = serializers.UserAddressSerializer(queryset, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        response = Response(await sync_to_async(lambda: serializer.data)(), status=status.HTTP_200_OK)
+        if len(token_ids) == limit:
+            response['X-Next-Cursor'] = token_ids[-1]
+        return response
 
 class EmailViewset(viewsets.GenericViewSet,
     mixins.ListModelMixin,
@@ -174,8 +228,34 @@ class EmailViewset(viewsets.GenericViewSet,
             content = serializer.errors
             return Response(content, status=status.HTTP_400_BAD_REQUEST)
 
-class SalesOrderViewset(BaseViewSet):
+class SalesOrderViewset(AsyncChainMixin, BaseViewSet):
     """Manage sales order in the database"""
     queryset = models.SalesOrder.objects.all()
     serializer_class = serializers.SalesOrderSerializer
-    permission_classes = [AllowAny]
\ No newline at end of file
+    permission_classes = [AllowAny]
+
+    @swagger_auto_schema(request_body=serializers.SalesOrderBulkSerializer)
+    @action(detail=False, methods=['post'])
+    async def bulk(self, request, *args, **kwargs):
+        """List many assets for sale, verifying their owners concurrently"""
+        serializer = serializers.SalesOrderBulkSerializer(data=request.data, context=self.get_serializer_context())
+        await serializer.aprefetch_validation_info()
+        await sync_to_async(serializer.is_valid)(raise_exception=True)
+        content = await sync_to_async(serializer.save)()
+        return Response(content, status=status.HTTP_201_CREATED if content['created'] else status.HTTP_400_BAD_REQUEST)
+
+class TransactionViewset(viewsets.GenericViewSet,
+    mixins.CreateModelMixin,
+    mixins.RetrieveModelMixin
+):
+    """Queue transaction hashes for on-chain verification"""
+    queryset = models.PendingTransaction.objects.all()
+    serializer_class = serializers.PendingTransactionSerializer
+    permission_classes = [AllowAny]
+    lookup_field = 'tx_hash'
+
+    def create(self, request, *args, **kwargs):
+        """Record a pending transaction, confirmed later by manage.py verify_transactions"""
+        response = super().create(request, *args, **kwargs)
+        response.status_code = status.HTTP_202_ACCEPTED
+        return response
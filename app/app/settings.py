@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/3.2/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -103,6 +104,22 @@ DATABASES = {
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Contract query results, in memcached: shared by every worker process
+    # (so invalidate_chain_cache reaches them all) and bounded by its memory
+    # limit (memcached -m), evicting the least recently used entries.
+    'chain': {
+        'BACKEND': os.environ.get('CHAIN_CACHE_BACKEND', 'django.core.cache.backends.memcached.PyMemcacheCache'),
+        'LOCATION': os.environ.get('CHAIN_CACHE_LOCATION', '127.0.0.1:11211'),
+    },
+}
+
 # Rest Framework
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
@@ -164,3 +181,179 @@ RESPONSE = {
     'STATUS_OK': 'OK',
     'STATUS_ERROR': 'ERROR'
 }
+
+# HTTP client shared by the sports data providers. Connections to each host
+# are kept alive in a pool of POOL_SIZE; 429 and 5xx responses and connection
+# errors are retried up to MAX_RETRIES times with jittered exponential backoff.
+# Batches fetched with fantasy.aclient run FAN_OUT requests at a time and give
+# each one DEADLINE seconds, retries included.
+PROVIDER_HTTP = {
+    'POOL_SIZE': int(os.environ.get('PROVIDER_HTTP_POOL_SIZE', 10)),
+    'CONNECT_TIMEOUT': float(os.environ.get('PROVIDER_HTTP_CONNECT_TIMEOUT', 5)),
+    'READ_TIMEOUT': float(os.environ.get('PROVIDER_HTTP_READ_TIMEOUT', 30)),
+    'MAX_RETRIES': int(os.environ.get('PROVIDER_HTTP_MAX_RETRIES', 3)),
+    'BACKOFF_BASE': float(os.environ.get('PROVIDER_HTTP_BACKOFF_BASE', 0.5)),
+    'BACKOFF_MAX': float(os.environ.get('PROVIDER_HTTP_BACKOFF_MAX', 10)),
+    'FAN_OUT': int(os.environ.get('PROVIDER_HTTP_FAN_OUT', 10)),
+    'DEADLINE': float(os.environ.get('PROVIDER_HTTP_DEADLINE', 30)),
+}
+
+# Per-host request budgets shared by every process on the host through files
+# in DIR. Each bucket refills at RATE requests per second up to BURST. A
+# priority class leaves RESERVE of the burst to the classes above it and
+# waits up to MAX_WAIT seconds for a token before the request fails.
+PROVIDER_RATE_LIMIT = {
+    'DIR': os.environ.get('PROVIDER_RATE_LIMIT_DIR', os.path.join(tempfile.gettempdir(), 'provider-rate-limit')),
+    'BUCKETS': {
+        'api.sportsdata.io': {
+            'RATE': float(os.environ.get('SPORTSDATA_RATE_LIMIT', 1)),
+            'BURST': int(os.environ.get('SPORTSDATA_RATE_LIMIT_BURST', 10)),
+        },
+        'api.stats.com': {
+            'RATE': float(os.environ.get('STATSPERFORM_RATE_LIMIT', 1)),
+            'BURST': int(os.environ.get('STATSPERFORM_RATE_LIMIT_BURST', 10)),
+        },
+    },
+    'PRIORITIES': {
+        'live': {
+            'RESERVE': 0,
+            'MAX_WAIT': float(os.environ.get('PROVIDER_RATE_LIMIT_LIVE_MAX_WAIT', 5)),
+        },
+        'sync': {
+            'RESERVE': float(os.environ.get('PROVIDER_RATE_LIMIT_SYNC_RESERVE', 0.5)),
+            'MAX_WAIT': float(os.environ.get('PROVIDER_RATE_LIMIT_SYNC_MAX_WAIT', 60)),
+        },
+    },
+}
+
+# On-disk cache of provider feeds (fantasy.feed_cache). Responses younger than
+# their endpoint's MAX_AGE seconds are served without a request; older ones are
+# revalidated with If-None-Match/If-Modified-Since.
+PROVIDER_CACHE = {
+    'DIR': os.environ.get('PROVIDER_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'provider-cache')),
+    'MAX_AGE': {
+        'scores/json/teams': int(os.environ.get('PROVIDER_CACHE_TEAMS_MAX_AGE', 86400)),
+        'scores/json/Players': int(os.environ.get('PROVIDER_CACHE_PLAYERS_MAX_AGE', 3600)),
+    },
+    'DEFAULT_MAX_AGE': 0,
+}
+
+# Provider feeds are written to the database in chunks of CHUNK_SIZE records.
+# The change log of synced records is served CHANGES_PAGE_SIZE entries at a time.
+FANTASY_INGEST = {
+    'CHUNK_SIZE': int(os.environ.get('FANTASY_INGEST_CHUNK_SIZE', 500)),
+    'CHANGES_PAGE_SIZE': int(os.environ.get('FANTASY_INGEST_CHANGES_PAGE_SIZE', 500)),
+}
+
+# Scheduled provider syncs run by manage.py sync_fantasy. SCHEDULE is the
+# number of seconds between two runs of each sync (0 only runs it on request).
+# A sync still marked running after LOCK_TIMEOUT seconds is assumed dead.
+# Finished jobs are deleted after RETENTION_DAYS days.
+FANTASY_SYNC = {
+    'SCHEDULE': {
+        'teams': int(os.environ.get('FANTASY_SYNC_TEAMS_EVERY', 86400)),
+        'players': int(os.environ.get('FANTASY_SYNC_PLAYERS_EVERY', 3600)),
+    },
+    'POLL_INTERVAL': float(os.environ.get('FANTASY_SYNC_POLL_INTERVAL', 5)),
+    'LOCK_TIMEOUT': int(os.environ.get('FANTASY_SYNC_LOCK_TIMEOUT', 3600)),
+    'RETENTION_DAYS': int(os.environ.get('FANTASY_SYNC_RETENTION_DAYS', 30)),
+}
+
+# Live box scores of in-progress games. A game is polled every LIVE_INTERVAL
+# seconds while it is played, every BREAK_INTERVAL seconds at halftime and
+# every PREGAME_INTERVAL seconds between its scheduled start and tipoff. The
+# intervals are stretched so that all live games together stay within
+# MAX_REQUESTS_PER_MINUTE; CONCURRENCY box scores are fetched at once.
+# manage.py poll_box_scores checks for due games at least every POLL_INTERVAL
+# seconds, sooner when a poll is due earlier.
+LIVE_STATS = {
+    'LIVE_INTERVAL': float(os.environ.get('LIVE_STATS_LIVE_INTERVAL', 15)),
+    'BREAK_INTERVAL': float(os.environ.get('LIVE_STATS_BREAK_INTERVAL', 60)),
+    'PREGAME_INTERVAL': float(os.environ.get('LIVE_STATS_PREGAME_INTERVAL', 30)),
+    'MAX_REQUESTS_PER_MINUTE': int(os.environ.get('LIVE_STATS_MAX_REQUESTS_PER_MINUTE', 60)),
+    'CONCURRENCY': int(os.environ.get('LIVE_STATS_CONCURRENCY', 8)),
+    'POLL_INTERVAL': float(os.environ.get('LIVE_STATS_POLL_INTERVAL', 5)),
+}
+
+# Record/replay of provider and LCD responses (core.fixtures), for offline
+# benchmarks. MODE is '' (off), 'record' or 'replay'. Replayed responses are
+# delayed by their recorded latency times LATENCY_SCALE plus LATENCY seconds,
+# and ERROR_RATE of them fail with ERROR_STATUS (drawn from SEED).
+RESPONSE_FIXTURES = {
+    'MODE': os.environ.get('RESPONSE_FIXTURES_MODE', ''),
+    'DIR': os.environ.get('RESPONSE_FIXTURES_DIR', os.path.join(BASE_DIR, 'fixtures', 'responses')),
+    'IGNORE_PARAMS': ['key', 'api_key', 'sig'],
+    'LATENCY_SCALE': float(os.environ.get('RESPONSE_FIXTURES_LATENCY_SCALE', 1)),
+    'LATENCY': float(os.environ.get('RESPONSE_FIXTURES_LATENCY', 0)),
+    'ERROR_RATE': float(os.environ.get('RESPONSE_FIXTURES_ERROR_RATE', 0)),
+    'ERROR_STATUS': int(os.environ.get('RESPONSE_FIXTURES_ERROR_STATUS', 503)),
+    'SEED': int(os.environ.get('RESPONSE_FIXTURES_SEED', 0)),
+}
+
+# Terra LCD client pool, shared by every chain query made by a worker process.
+# Queries go to the healthiest of URLS; an endpoint failing FAILURE_THRESHOLD
+# times in a row is skipped for RECOVERY_TIMEOUT seconds. Reads still pending
+# after HEDGE_AFTER seconds are also sent to the next endpoint (0 disables).
+TERRA_LCD = {
+    'URLS': os.environ.get('TERRA_LCD_URLS', os.environ.get('TERRA_LCD_URL', 'https://bombay-lcd.terra.dev')).split(','),
+    'CHAIN_ID': os.environ.get('TERRA_CHAIN_ID', 'bombay-12'),
+    'POOL_SIZE': int(os.environ.get('TERRA_LCD_POOL_SIZE', 20)),
+    'KEEPALIVE_TIMEOUT': float(os.environ.get('TERRA_LCD_KEEPALIVE_TIMEOUT', 30)),
+    'CONNECT_TIMEOUT': float(os.environ.get('TERRA_LCD_CONNECT_TIMEOUT', 5)),
+    'READ_TIMEOUT': float(os.environ.get('TERRA_LCD_READ_TIMEOUT', 15)),
+    'MAX_CONCURRENCY': int(os.environ.get('TERRA_LCD_MAX_CONCURRENCY', 16)),
+    'FAILURE_THRESHOLD': int(os.environ.get('TERRA_LCD_FAILURE_THRESHOLD', 3)),
+    'RECOVERY_TIMEOUT': float(os.environ.get('TERRA_LCD_RECOVERY_TIMEOUT', 30)),
+    'HEDGE_AFTER': float(os.environ.get('TERRA_LCD_HEDGE_AFTER', 0.5)),
+}
+
+# Seconds a contract query result is cached, per query type (0 disables caching)
+TERRA_QUERY_CACHE = {
+    'TTL': {
+        'contract_info': int(os.environ.get('CHAIN_CACHE_CONTRACT_INFO_TTL', 86400)),
+        'nft_info': int(os.environ.get('CHAIN_CACHE_NFT_INFO_TTL', 300)),
+    },
+    'DEFAULT_TTL': 0,
+}
+
+# NFT metadata snapshots are refreshed from the chain once older than MAX_AGE_BLOCKS
+NFT_INFO = {
+    'MAX_AGE_BLOCKS': int(os.environ.get('NFT_INFO_MAX_AGE_BLOCKS', 600)),
+    'HEIGHT_TTL': int(os.environ.get('NFT_INFO_HEIGHT_TTL', 6)),
+}
+
+# Token owners verified for listings are cached for TTL seconds per block height
+OWNERSHIP = {
+    'TTL': int(os.environ.get('OWNERSHIP_TTL', 6)),
+}
+
+# Chain indexer (manage.py index_chain). Wallet assets are served from the
+# database while the indexer is at most MAX_LAG_BLOCKS behind the chain, and
+# from the LCD otherwise.
+INDEXER = {
+    'POLL_INTERVAL': float(os.environ.get('INDEXER_POLL_INTERVAL', 6)),
+    'WINDOW': int(os.environ.get('INDEXER_WINDOW', 20)),
+    'MAX_LAG_BLOCKS': int(os.environ.get('INDEXER_MAX_LAG_BLOCKS', 10)),
+}
+
+# Transaction verifier (manage.py verify_transactions). Hashes the chain does
+# not know yet are retried with exponential backoff, up to MAX_ATTEMPTS times.
+TX_VERIFIER = {
+    'POLL_INTERVAL': float(os.environ.get('TX_VERIFIER_POLL_INTERVAL', 2)),
+    'BATCH_SIZE': int(os.environ.get('TX_VERIFIER_BATCH_SIZE', 100)),
+    'BACKOFF_BASE': float(os.environ.get('TX_VERIFIER_BACKOFF_BASE', 2)),
+    'BACKOFF_MAX': float(os.environ.get('TX_VERIFIER_BACKOFF_MAX', 300)),
+    'MAX_ATTEMPTS': int(os.environ.get('TX_VERIFIER_MAX_ATTEMPTS', 20)),
+    'LEASE_SECONDS': int(os.environ.get('TX_VERIFIER_LEASE_SECONDS', 60)),
+}
+
+# Page size of /account/assets/account/<wallet>/collection/<contract>
+ACCOUNT_ASSETS = {
+    'PAGE_SIZE': int(os.environ.get('ACCOUNT_ASSETS_PAGE_SIZE', 100)),
+    'MAX_PAGE_SIZE': int(os.environ.get('ACCOUNT_ASSETS_MAX_PAGE_SIZE', 500)),
+}
+
+# Largest number of orders accepted by one POST to sales/bulk
+SALES_ORDERS = {
+    'BULK_MAX_ORDERS': int(os.environ.get('SALES_ORDERS_BULK_MAX_ORDERS', 500)),
+}
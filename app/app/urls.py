@@ -22,6 +22,7 @@ from drf_yasg import openapi
 
 from account import views as account_views
 from fantasy import views as fantasy_views
+from core import views as core_views
 
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
@@ -55,6 +56,8 @@ urlpatterns = [
     #custom urls
     path('account/assets/account/<str:wallet>/collection/<str:contract>', account_views.AccountAssetView.as_view()),
     path('fantasy/game/<int:pk>/leaderboard', fantasy_views.GameLeaderboardView.as_view()),
+    path('metrics', core_views.MetricsView.as_view()),
+    path('fantasy/rate-limits', fantasy_views.RateLimitView.as_view()),
 
     #admin
     path('admin/', admin.site.urls),
@@ -1,7 +1,8 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin 
 from django.utils.translation import gettext as _
 
+from core import chain_cache
 from user import models as user
 from fantasy import models as fantasy
 from account import models as account
@@ -28,16 +29,34 @@ class UserAdmin(BaseUserAdmin):
 admin.site.register(account.Account)
 admin.site.register(account.PrelaunchEmail)
 admin.site.register(account.Asset)
-admin.site.register(account.Collection)
+admin.site.register(account.NftInfo)
 admin.site.register(account.SalesOrder)
+admin.site.register(account.PendingTransaction)
 admin.site.register(fantasy.Game)
 admin.site.register(fantasy.GameSchedule)
 admin.site.register(fantasy.GameTeam)
 admin.site.register(fantasy.GameAthlete)
 admin.site.register(fantasy.GameAsset)
 admin.site.register(fantasy.GameAthleteStat)
+admin.site.register(fantasy.ChangeLog)
+admin.site.register(fantasy.SyncJob)
 admin.site.register(user.User, UserAdmin)
 
+@admin.register(account.Collection)
+class CollectionAdmin(admin.ModelAdmin):
+    list_display = ('id', 'contract_addr')
+    actions = ['invalidate_chain_cache']
+
+    @admin.action(description=_('Invalidate cached chain queries'))
+    def invalidate_chain_cache(self, request, queryset):
+        try:
+            for collection in queryset:
+                chain_cache.invalidate(collection.contract_addr)
+        except chain_cache.ProcessLocalCache as e:
+            self.message_user(request, str(e), messages.ERROR)
+            return
+        self.message_user(request, _('Cached chain queries invalidated.'))
+
 @admin.register(fantasy.Athlete)
 class AthleteAdmin(admin.ModelAdmin):
     list_display = ('first_name', 'last_name', 'api_id', 'position')
@@ -0,0 +1,91 @@
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+
+from . import metrics
+
+# Contract query results are cached in the 'chain' cache (memcached by
+# default, which evicts the least recently used entries). Each contract has a
+# version that is part of every key, so invalidating a contract is a single
+# write. With a cache backend shared between processes the invalidation
+# reaches every worker. Versions are unique stamps rather than counters: a
+# version key the cache evicted is replaced by a new stamp, which orphans the
+# entries written under the old one instead of serving them again.
+
+_MISSING = object()
+
+class ProcessLocalCache(Exception):
+    """Raised when invalidating a cache that other processes cannot see"""
+
+def get_cache():
+    return caches['chain']
+
+def is_shared():
+    """Whether the 'chain' cache is shared with the other processes"""
+    return not isinstance(get_cache(), LocMemCache)
+
+def query_type(query_msg):
+    return next(iter(query_msg), '')
+
+def get_ttl(query_msg):
+    """Seconds a query result may be served from the cache, 0 to bypass it"""
+    config = settings.TERRA_QUERY_CACHE
+    return config['TTL'].get(query_type(query_msg), config['DEFAULT_TTL'])
+
+def _version_key(contract_addr):
+    return 'version:' + str(contract_addr)
+
+def _version(cache, contract_addr):
+    version_key = _version_key(contract_addr)
+    version = cache.get(version_key)
+    if version is None:
+        # First use, or evicted: start a new version (another process may win the add)
+        cache.add(version_key, time.time_ns(), None)
+        version = cache.get(version_key, 0)
+    return version
+
+def _key(contract_addr, query_msg, version):
+    digest = hashlib.sha1(json.dumps(query_msg, sort_keys=True).encode()).hexdigest()
+    return f'{contract_addr}:{version}:{digest}'
+
+def get(contract_addr, query_msg):
+    """Return (hit, response) for a cached contract query"""
+    if not get_ttl(query_msg):
+        return False, None
+
+    cache = get_cache()
+    version = _version(cache, contract_addr)
+    response = cache.get(_key(contract_addr, query_msg, version), _MISSING)
+    name = 'chain_cache.hits' if response is not _MISSING else 'chain_cache.misses'
+    metrics.incr(name)
+    metrics.incr(name + '.' + query_type(query_msg))
+    if response is _MISSING:
+        return False, None
+    return True, response
+
+def set(contract_addr, query_msg, response):
+    ttl = get_ttl(query_msg)
+    if not ttl:
+        return
+
+    cache = get_cache()
+    version = _version(cache, contract_addr)
+    cache.set(_key(contract_addr, query_msg, version), response, ttl)
+
+def invalidate(contract_addr):
+    """Drop every cached query result of a contract.
+
+    Raises ProcessLocalCache with a per-process backend, which only the
+    current process would see invalidated.
+    """
+    if not is_shared():
+        raise ProcessLocalCache(
+            f"The 'chain' cache ({settings.CACHES['chain']['BACKEND']}) is local to each process, "
+            'set CHAIN_CACHE_BACKEND to a shared backend to invalidate it'
+        )
+    get_cache().set(_version_key(contract_addr), time.time_ns(), None)
+    metrics.incr('chain_cache.invalidations')
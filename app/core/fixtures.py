@@ -0,0 +1,192 @@
+import asyncio
+import contextlib
+import gzip
+import hashlib
+import io
+import json
+import os
+import random
+import threading
+import time
+from urllib.parse import parse_qsl, urlsplit
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from django.conf import settings
+
+from . import metrics
+
+# Record/replay of outbound HTTP calls, for benchmarks and load tests that
+# must not reach SportsData, Stats Perform or the Terra LCD. With
+# RESPONSE_FIXTURES['MODE'] = 'record' every response is saved as a gzipped
+# JSON file under DIR, keyed on method, URL, query (minus IGNORE_PARAMS, such
+# as API keys and signatures) and body. 'replay' serves those files back
+# instead, after the recorded latency times LATENCY_SCALE plus LATENCY, and
+# fails ERROR_RATE of the calls with ERROR_STATUS. Injected errors are drawn
+# from a generator seeded with SEED, so a replay is repeatable.
+
+RECORD = 'record'
+REPLAY = 'replay'
+
+_random_lock = threading.Lock()
+_random = None
+
+def get_mode():
+    return settings.RESPONSE_FIXTURES['MODE']
+
+class FixtureMissing(Exception):
+    """Raised in replay mode for a request that was never recorded"""
+
+def _key(method, url, params=(), body=None):
+    parts = urlsplit(url)
+    ignored = settings.RESPONSE_FIXTURES['IGNORE_PARAMS']
+    query = sorted(
+        (str(name), str(value))
+        for name, value in list(parse_qsl(parts.query)) + list(params)
+        if name not in ignored
+    )
+    digest = hashlib.sha1(json.dumps(
+        [method.upper(), parts.scheme + '://' + parts.netloc + parts.path, query, body],
+        sort_keys=True, default=str
+    ).encode()).hexdigest()
+    return parts.netloc.replace(':', '_'), digest
+
+def _path(key):
+    host, digest = key
+    return os.path.join(settings.RESPONSE_FIXTURES['DIR'], host, digest + '.json.gz')
+
+def save(method, url, params, body, status, reason, headers, content, elapsed):
+    """Record one response"""
+    path = _path(_key(method, url, params, body))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fixture = {
+        'method': method.upper(),
+        'url': url,
+        'params': [[str(name), str(value)] for name, value in params],
+        'status': status,
+        'reason': reason,
+        'headers': {name: value for name, value in headers.items() if name.lower() not in ('content-encoding', 'content-length', 'transfer-encoding')},
+        'body': content.decode('utf-8'),
+        'elapsed': elapsed,
+    }
+    tmp_path = path + '.' + str(os.getpid()) + '.tmp'
+    with gzip.open(tmp_path, 'wt') as f:
+        json.dump(fixture, f)
+    os.replace(tmp_path, path)
+    metrics.incr('fixtures.recorded')
+
+def _injected_error():
+    global _random
+    config = settings.RESPONSE_FIXTURES
+    if not config['ERROR_RATE']:
+        return False
+    with _random_lock:
+        if _random is None:
+            _random = random.Random(config['SEED'])
+        return _random.random() < config['ERROR_RATE']
+
+def load(method, url, params=(), body=None):
+    """Return (recorded response, seconds to wait before serving it) in replay mode.
+
+    The status of an injected error replaces the recorded one. Raises
+    FixtureMissing if the request was not recorded.
+    """
+    config = settings.RESPONSE_FIXTURES
+    path = _path(_key(method, url, params, body))
+    try:
+        with gzip.open(path, 'rt') as f:
+            fixture = json.load(f)
+    except FileNotFoundError:
+        metrics.incr('fixtures.missing')
+        raise FixtureMissing(f'No recorded response for {method.upper()} {url} ({path})')
+    if _injected_error():
+        metrics.incr('fixtures.injected_errors')
+        fixture = dict(fixture, status=config['ERROR_STATUS'], reason='Injected error', body='{"error": "injected error"}')
+    metrics.incr('fixtures.replayed')
+    return fixture, fixture.get('elapsed', 0) * config['LATENCY_SCALE'] + config['LATENCY']
+
+class RequestsAdapter(HTTPAdapter):
+    """Transport adapter recording or replaying the provider session's responses"""
+
+    def send(self, request, stream=False, **kwargs):
+        method = request.method
+        body = request.body.decode() if isinstance(request.body, bytes) else request.body
+        if get_mode() == REPLAY:
+            try:
+                fixture, delay = load(method, request.url, body=body)
+            except FixtureMissing as e:
+                raise requests.exceptions.ConnectionError(str(e), request=request)
+            time.sleep(delay)
+            response = requests.Response()
+            response.status_code = fixture['status']
+            response.reason = fixture['reason']
+            response.headers = CaseInsensitiveDict(fixture['headers'])
+            response.encoding = get_encoding_from_headers(response.headers)
+            response.raw = io.BytesIO(fixture['body'].encode('utf-8'))
+            response.url = request.url
+            response.request = request
+            return response
+
+        start = time.monotonic()
+        response = super().send(request, stream=stream, **kwargs)
+        # Reading the body here also lets a streamed response be iterated from memory
+        save(method, request.url, (), body, response.status_code, response.reason, response.headers, response.content, time.monotonic() - start)
+        return response
+
+class _AsyncResponse:
+    """The part of aiohttp.ClientResponse that terra_sdk reads"""
+
+    def __init__(self, status, reason, headers, content):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self._content = content
+
+    async def read(self):
+        return self._content
+
+    async def text(self, encoding='utf-8'):
+        return self._content.decode(encoding)
+
+    async def json(self, content_type=None, loads=json.loads):
+        return loads(self._content.decode('utf-8'))
+
+class AsyncSession:
+    """Wraps the LCD aiohttp.ClientSession to record or replay its responses"""
+
+    def __init__(self, session):
+        self._session = session
+
+    @property
+    def closed(self):
+        return self._session.closed
+
+    async def close(self):
+        await self._session.close()
+
+    def get(self, url, params=None, **kwargs):
+        return self._request('GET', url, params=params, **kwargs)
+
+    def post(self, url, json=None, **kwargs):
+        return self._request('POST', url, json=json, **kwargs)
+
+    @contextlib.asynccontextmanager
+    async def _request(self, method, url, params=None, json=None, **kwargs):
+        params = list((params or {}).items())
+        if get_mode() == REPLAY:
+            try:
+                fixture, delay = load(method, url, params, json)
+            except FixtureMissing as e:
+                raise aiohttp.ClientConnectionError(str(e))
+            await asyncio.sleep(delay)
+            yield _AsyncResponse(fixture['status'], fixture['reason'], fixture['headers'], fixture['body'].encode('utf-8'))
+            return
+
+        start = time.monotonic()
+        async with self._session.request(method, url, params=params or None, json=json, **kwargs) as response:
+            content = await response.read()
+        save(method, url, params, json, response.status, response.reason, response.headers, content, time.monotonic() - start)
+        yield _AsyncResponse(response.status, response.reason, response.headers, content)
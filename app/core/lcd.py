@@ -0,0 +1,252 @@
+import asyncio
+import atexit
+import functools
+import os
+import threading
+import time
+
+import aiohttp
+from django.conf import settings
+from terra_sdk.client.lcd import AsyncLCDClient
+from terra_sdk.exceptions import LCDResponseError
+
+from . import fixtures
+from . import metrics
+
+
+def _trace_config():
+    """Report request timings and connection reuse of the LCD session"""
+    async def on_request_start(session, context, params):
+        context.start = time.monotonic()
+
+    async def on_request_end(session, context, params):
+        metrics.incr('lcd.requests')
+        metrics.observe('lcd.request_seconds', time.monotonic() - context.start)
+
+    async def on_request_exception(session, context, params):
+        metrics.incr('lcd.requests.failed')
+
+    async def on_connection_create_end(session, context, params):
+        metrics.incr('lcd.connections.created')
+
+    async def on_connection_reuseconn(session, context, params):
+        metrics.incr('lcd.connections.reused')
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_request_end.append(on_request_end)
+    trace_config.on_request_exception.append(on_request_exception)
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+    trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+    return trace_config
+
+
+class LCDUnavailableError(Exception):
+    """Raised when the circuit breaker of every LCD endpoint is open"""
+
+
+def is_node_failure(error):
+    """True for errors that say something about the node rather than the query"""
+    if isinstance(error, LCDResponseError):
+        return error.response.status >= 500
+    return isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError))
+
+
+class Endpoint:
+    """An LCD node with a circuit breaker and a latency estimate"""
+
+    def __init__(self, client):
+        self.client = client
+        self.url = client.url
+        self.failures = 0
+        self.opened_at = None
+        self.latency = 0.0
+
+    def is_available(self):
+        # Open breakers let requests through again (half-open) after RECOVERY_TIMEOUT
+        return self.opened_at is None or time.monotonic() - self.opened_at >= settings.TERRA_LCD['RECOVERY_TIMEOUT']
+
+    def observe(self, latency):
+        self.latency = latency if not self.latency else 0.8 * self.latency + 0.2 * latency
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        metrics.gauge('lcd.endpoint.' + self.url + '.open', 0)
+
+    def record_failure(self):
+        self.failures += 1
+        metrics.incr('lcd.endpoint.' + self.url + '.failures')
+        if self.opened_at is not None or self.failures >= settings.TERRA_LCD['FAILURE_THRESHOLD']:
+            self.opened_at = time.monotonic()
+            metrics.gauge('lcd.endpoint.' + self.url + '.open', 1)
+
+
+class LCDClientPool:
+    """Per-process LCD clients backed by a keep-alive connection pool.
+
+    The clients live on a dedicated event loop thread so that their aiohttp
+    session, and the connections it holds, survive across requests. Requests
+    go to the healthiest of the TERRA_LCD['URLS'] endpoints and fail over to
+    the others.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._loop = None
+        self._thread = None
+        self._session = None
+        self._endpoints = None
+
+    @property
+    def loop(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    # Fresh process (or forked worker): the parent's loop thread does not exist here.
+                    self._session = None
+                    self._endpoints = None
+                    self._loop = asyncio.new_event_loop()
+                    self._thread = threading.Thread(
+                        target=self._loop.run_forever,
+                        name='lcd-client-pool',
+                        daemon=True
+                    )
+                    self._thread.start()
+                    self._pid = os.getpid()
+        return self._loop
+
+    def endpoints(self):
+        """Return the endpoints. Must be called from a coroutine running on the pool loop."""
+        if self._endpoints is None:
+            config = settings.TERRA_LCD
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=config['POOL_SIZE'],
+                    keepalive_timeout=config['KEEPALIVE_TIMEOUT'],
+                ),
+                timeout=aiohttp.ClientTimeout(
+                    connect=config['CONNECT_TIMEOUT'],
+                    sock_read=config['READ_TIMEOUT'],
+                ),
+                headers={"Accept": "application/json"},
+                trace_configs=[_trace_config()],
+            )
+            if fixtures.get_mode():
+                self._session = fixtures.AsyncSession(self._session)
+            self._endpoints = []
+            for url in config['URLS']:
+                client = AsyncLCDClient(url, config['CHAIN_ID'], loop=self._loop, _create_session=False)
+                client.session = self._session
+                self._endpoints.append(Endpoint(client))
+        return self._endpoints
+
+    async def _attempt(self, endpoint, request):
+        start = time.monotonic()
+        try:
+            response = await request(endpoint.client)
+        except asyncio.CancelledError:
+            # Lost a hedge: the endpoint took at least this long
+            endpoint.observe(time.monotonic() - start)
+            raise
+        except Exception as e:
+            if is_node_failure(e):
+                endpoint.record_failure()
+            else:
+                endpoint.observe(time.monotonic() - start)
+                endpoint.record_success()
+            raise
+        endpoint.observe(time.monotonic() - start)
+        endpoint.record_success()
+        return response
+
+    async def call(self, request, hedge=False):
+        """Await ``request(client)`` on the healthiest endpoint, failing over to the others.
+
+        With ``hedge`` a read that has not answered after TERRA_LCD['HEDGE_AFTER']
+        seconds is also sent to the next endpoint, and the first answer wins.
+        Only node failures (connection errors, timeouts, 5xx) fail over and
+        count against an endpoint's circuit breaker.
+        """
+        candidates = sorted([endpoint for endpoint in self.endpoints() if endpoint.is_available()], key=lambda endpoint: endpoint.latency)
+        if not candidates:
+            metrics.incr('lcd.rejected')
+            raise LCDUnavailableError('Every LCD endpoint is failing.')
+
+        hedge_after = settings.TERRA_LCD['HEDGE_AFTER'] if hedge else 0
+        pending = set()
+        error = None
+        try:
+            while candidates or pending:
+                if not pending:
+                    if error is not None:
+                        metrics.incr('lcd.failovers')
+                    pending.add(asyncio.ensure_future(self._attempt(candidates.pop(0), request)))
+                done, pending = await asyncio.wait(
+                    pending,
+                    timeout=hedge_after if hedge_after and candidates else None,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    metrics.incr('lcd.hedged')
+                    pending.add(asyncio.ensure_future(self._attempt(candidates.pop(0), request)))
+                    continue
+                succeeded = [task for task in done if task.exception() is None]
+                if succeeded:
+                    return succeeded[0].result()
+                for task in done:
+                    if not is_node_failure(task.exception()):
+                        raise task.exception()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def submit(self, coro):
+        """Schedule a coroutine on the pool loop and return a concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro):
+        """Run a coroutine on the pool loop and block until it finishes"""
+        return self.submit(coro).result()
+
+    async def run_async(self, coro):
+        """Run a coroutine on the pool loop and await it from another loop"""
+        return await asyncio.wrap_future(self.submit(coro))
+
+    def close(self):
+        """Close pooled connections and stop the loop thread"""
+        if self._pid != os.getpid():
+            return
+        if self._session is not None:
+            self.run(self._session.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        self._loop.close()
+        self._pid = None
+        self._loop = None
+        self._thread = None
+        self._session = None
+        self._endpoints = None
+
+
+pool = LCDClientPool()
+atexit.register(pool.close)
+
+
+def on_pool(func):
+    """Run a coroutine function on the shared LCD pool when called from sync code.
+
+    Async callers can await ``func.run_async(...)`` instead of blocking.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return pool.run(func(*args, **kwargs))
+
+    async def run_async(*args, **kwargs):
+        return await pool.run_async(func(*args, **kwargs))
+
+    wrapper.run_async = run_async
+    return wrapper
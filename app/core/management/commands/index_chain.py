@@ -0,0 +1,29 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from rest_framework import serializers
+
+from account import indexer
+
+class Command(BaseCommand):
+    """Django command to keep asset ownership in sync with the chain"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Index up to the latest block and exit.')
+        parser.add_argument('--interval', type=float, default=settings.INDEXER['POLL_INTERVAL'],
+            help='Seconds to wait between polls for new blocks.')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Indexing collections...')
+        while True:
+            start = time.monotonic()
+            try:
+                height = indexer.run_once()
+                self.stdout.write(f'Indexed up to block {height} in {time.monotonic() - start:.2f}s')
+            except serializers.ValidationError as e:
+                self.stderr.write(f'Indexing failed, retrying in {options["interval"]} seconds: {e}')
+
+            if options['once']:
+                break
+            time.sleep(options['interval'])
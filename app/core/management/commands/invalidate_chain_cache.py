@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core import chain_cache
+
+class Command(BaseCommand):
+    """Django command to drop cached chain query results of contracts"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('contract_addr', nargs='+')
+
+    def handle(self, *args, **options):
+        for contract_addr in options['contract_addr']:
+            try:
+                chain_cache.invalidate(contract_addr)
+            except chain_cache.ProcessLocalCache as e:
+                raise CommandError(e)
+            self.stdout.write(f'Invalidated cached queries of {contract_addr}')
+
+        self.stdout.write(self.style.SUCCESS('Chain cache invalidated!'))
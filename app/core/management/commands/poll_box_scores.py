@@ -0,0 +1,31 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from fantasy import box_scores
+
+class Command(BaseCommand):
+    """Django command to poll the live box scores of started games"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Poll the games due now and exit.')
+        parser.add_argument('--interval', type=float, default=settings.LIVE_STATS['POLL_INTERVAL'],
+            help='Most seconds to wait between two checks for due games.')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Polling live box scores...')
+        while True:
+            start = time.monotonic()
+            try:
+                result = box_scores.run_once()
+                if result['polled']:
+                    self.stdout.write(f'Polled {result["polled"]} box scores in {time.monotonic() - start:.2f}s: {result}')
+            except Exception as e:
+                self.stderr.write(f'Polling failed, retrying in {options["interval"]} seconds: {e!r}')
+
+            if options['once']:
+                break
+            # Sleep until the next game is due, checking at least every interval
+            due = box_scores.seconds_until_due()
+            time.sleep(min(options['interval'] if due is None else due, options['interval']))
@@ -0,0 +1,83 @@
+import json
+import time
+
+from aiohttp import web
+from django.core.management.base import BaseCommand
+
+class Command(BaseCommand):
+    """Django command to serve recorded blocks and contract queries as a local LCD.
+
+    The fixture is a JSON file of the form
+        {
+            "blocks": [{"height": 101, "txs": [<tx search result>, ...]}, ...],
+            "queries": [{"contract_addr": "...", "query_msg": {...}, "result": {...}}, ...]
+        }
+    Blocks are released one at a time, every --block-time seconds, so an
+    indexer pointed at TERRA_LCD_URL sees the chain advance. Transactions of
+    released blocks can also be looked up by their txhash.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('fixture')
+        parser.add_argument('--port', type=int, default=1317)
+        parser.add_argument('--block-time', type=float, default=1.0,
+            help='Seconds between two replayed blocks. 0 releases every block at once.')
+
+    def handle(self, *args, **options):
+        with open(options['fixture']) as fixture:
+            data = json.load(fixture)
+        blocks = {int(block['height']): block.get('txs', []) for block in data.get('blocks', [])}
+        queries = {
+            (query['contract_addr'], json.dumps(query['query_msg'], sort_keys=True)): query['result']
+            for query in data.get('queries', [])
+        }
+        tx_heights = {tx['txhash']: height for height, txs in blocks.items() for tx in txs if 'txhash' in tx}
+        heights = sorted(blocks) or [1]
+        started = time.monotonic()
+
+        def latest_height():
+            if not options['block_time']:
+                return heights[-1]
+            released = int((time.monotonic() - started) / options['block_time'])
+            return heights[min(released, len(heights) - 1)]
+
+        async def block_info(request):
+            height = latest_height() if request.match_info['height'] == 'latest' else int(request.match_info['height'])
+            return web.json_response({'block': {'header': {'height': str(height)}, 'data': {'txs': []}}})
+
+        async def tx_search(request):
+            height = int(request.query['tx.height'])
+            if height > latest_height():
+                return web.json_response({'error': 'height is not available'}, status=400)
+            txs = blocks.get(height, [])
+            return web.json_response({
+                'total_count': str(len(txs)),
+                'count': str(len(txs)),
+                'page_number': '1',
+                'page_total': '1',
+                'txs': txs,
+            })
+
+        async def tx_info(request):
+            tx_hash = request.match_info['tx_hash']
+            height = tx_heights.get(tx_hash)
+            if height is None or height > latest_height():
+                return web.json_response({'error': f'tx ({tx_hash}) not found'}, status=404)
+            tx = next(tx for tx in blocks[height] if tx.get('txhash') == tx_hash)
+            return web.json_response(dict(tx, height=str(height)))
+
+        async def contract_query(request):
+            query_msg = json.loads(request.query['query_msg'])
+            key = (request.match_info['contract_addr'], json.dumps(query_msg, sort_keys=True))
+            if key not in queries:
+                return web.json_response({'error': 'query not recorded'}, status=404)
+            return web.json_response({'height': str(latest_height()), 'result': queries[key]})
+
+        app = web.Application()
+        app.router.add_get('/blocks/{height}', block_info)
+        app.router.add_get('/txs', tx_search)
+        app.router.add_get('/txs/{tx_hash}', tx_info)
+        app.router.add_get('/wasm/contracts/{contract_addr}/store', contract_query)
+
+        self.stdout.write(f'Replaying blocks {heights[0]}-{heights[-1]} on port {options["port"]}...')
+        web.run_app(app, port=options['port'], print=None)
@@ -0,0 +1,37 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from fantasy import ingest
+
+class Command(BaseCommand):
+    """Django command to run queued and scheduled provider syncs"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('kinds', nargs='*',
+            help='Syncs (teams, players) to queue right away and run. Defaults to every sync, on its FANTASY_SYNC schedule.')
+        parser.add_argument('--once', action='store_true', help='Run the jobs due now and exit.')
+        parser.add_argument('--interval', type=float, default=settings.FANTASY_SYNC['POLL_INTERVAL'],
+            help='Seconds between two checks for due jobs.')
+
+    def handle(self, *args, **options):
+        unknown = set(options['kinds']) - set(ingest.SYNCS)
+        if unknown:
+            raise CommandError('Unknown syncs: ' + ', '.join(sorted(unknown)))
+        for kind in options['kinds']:
+            ingest.enqueue(kind)
+
+        self.stdout.write('Running provider syncs...')
+        while True:
+            start = time.monotonic()
+            for job in ingest.run_once(options['kinds']):
+                seconds = (job.finished_at - job.started_at).total_seconds()
+                if job.status == ingest.Status.SUCCEEDED:
+                    self.stdout.write(f'Synced {job.kind} (job {job.pk}) in {seconds:.2f}s: {job.result}')
+                else:
+                    self.stdout.write(self.style.ERROR(f'Failed to sync {job.kind} (job {job.pk}) after {seconds:.2f}s: {job.error}'))
+
+            if options['once']:
+                break
+            time.sleep(max(options['interval'] - (time.monotonic() - start), 0))
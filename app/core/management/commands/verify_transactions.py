@@ -0,0 +1,30 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from account import tx_verifier
+
+class Command(BaseCommand):
+    """Django command to confirm pending transactions on chain"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Verify the transactions due now and exit.')
+        parser.add_argument('--interval', type=float, default=settings.TX_VERIFIER['POLL_INTERVAL'],
+            help='Seconds to wait when no transaction is due.')
+        parser.add_argument('--batch-size', type=int, default=settings.TX_VERIFIER['BATCH_SIZE'],
+            help='Transactions looked up concurrently per batch.')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Verifying transactions...')
+        while True:
+            start = time.monotonic()
+            count = tx_verifier.run_once(options['batch_size'])
+            if count:
+                self.stdout.write(f'Looked up {count} transactions in {time.monotonic() - start:.2f}s')
+
+            # A full batch means more may be due right away
+            if count < options['batch_size']:
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
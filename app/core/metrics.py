@@ -0,0 +1,40 @@
+import threading
+from collections import defaultdict
+
+# In-process counters and timings. Each worker process keeps its own values.
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_gauges = {}
+_timings = {}
+
+def incr(name, value=1):
+    with _lock:
+        _counters[name] += value
+
+def gauge(name, value):
+    with _lock:
+        _gauges[name] = value
+
+def observe(name, value):
+    with _lock:
+        timing = _timings.setdefault(name, {'count': 0, 'total': 0.0, 'max': 0.0})
+        timing['count'] += 1
+        timing['total'] += value
+        timing['max'] = max(timing['max'], value)
+
+def snapshot():
+    with _lock:
+        return {
+            'counters': dict(_counters),
+            'gauges': dict(_gauges),
+            'timings': {
+                name: dict(timing, avg=timing['total'] / timing['count'])
+                for name, timing in _timings.items()
+            },
+        }
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _timings.clear()
@@ -1,29 +1,176 @@
-from terra_sdk.client.lcd import AsyncLCDClient
-from asgiref.sync import async_to_sync
+import asyncio
+import json
+
+from django.conf import settings
 from rest_framework import serializers
+from terra_sdk.exceptions import LCDResponseError
 
+from . import chain_cache
+from . import metrics
 from . import utils
+from .lcd import pool, on_pool
+
+# Page size asked for in tokens/all_tokens queries (the cw721-base maximum).
+# Contracts may cap it lower, so only an empty page ends the listing.
+TOKENS_PAGE_LIMIT = 30
+
+def query_key(contract_addr, query_msg):
+    """Stable key identifying a contract query"""
+    return (str(contract_addr), json.dumps(query_msg, sort_keys=True, separators=(',', ':')))
+
+async def _gather(coros, return_exceptions=False):
+    """Await coroutines concurrently, at most TERRA_LCD['MAX_CONCURRENCY'] at a time"""
+    semaphore = asyncio.Semaphore(settings.TERRA_LCD['MAX_CONCURRENCY'])
 
-@async_to_sync
+    async def run(coro):
+        async with semaphore:
+            return await coro
+
+    return await asyncio.gather(*[run(coro) for coro in coros], return_exceptions=return_exceptions)
+
+@on_pool
 async def get_latest_block_height():
-    terra = AsyncLCDClient("https://bombay-lcd.terra.dev", "bombay-12")
-    block_height = await terra.tendermint.block_info()
-    return block_height['block']['header']['height']
+    try:
+        block_height = await pool.call(lambda terra: terra.tendermint.block_info(), hedge=True)
+        return block_height['block']['header']['height']
+    except Exception as e:
+        raise serializers.ValidationError('Failed to retrieve information from the blockchain: ' + str(e))
+
+async def _get_block_txs(height):
+    try:
+        txs = []
+        page = 1
+        while True:
+            options = {'tx.height': height, 'limit': 100, 'page': page}
+            response = await pool.call(lambda terra: terra.tx.search(options), hedge=True)
+            txs.extend(response.get('txs') or [])
+            if page >= int(response.get('page_total') or 1):
+                return txs
+            page += 1
+    except Exception as e:
+        raise serializers.ValidationError('Failed to retrieve information from the blockchain: ' + str(e))
+
+get_block_txs = on_pool(_get_block_txs)
 
-@async_to_sync
-async def get_tx_info(tx_hash):
+@on_pool
+async def get_block_txs_many(heights):
+    """Fetch the transactions of several blocks concurrently, in the order of ``heights``"""
+    return await _gather([_get_block_txs(height) for height in heights])
+
+async def _get_tx_info(tx_hash):
+    """Return the tx_info of a transaction as a dict, or None if the node does not know the hash (yet)"""
     try:
-        terra = AsyncLCDClient("https://bombay-lcd.terra.dev", "bombay-12")
-        tx_info = await terra.tx.tx_info(tx_hash)
-        return tx_info
-    except:
+        tx_info = await pool.call(lambda terra: terra.tx.tx_info(tx_hash), hedge=True)
+        return tx_info.to_data()
+    except LCDResponseError as e:
+        if e.response.status < 500:
+            return None
+        raise serializers.ValidationError('Failed to retrieve information from the blockchain: ' + str(e))
+    except Exception as e:
         raise serializers.ValidationError('Failed to retrieve information from the blockchain: ' + str(e))
 
-@async_to_sync
-async def query_contract(contract_addr, query_msg):
+get_tx_info = on_pool(_get_tx_info)
+
+@on_pool
+async def get_tx_info_many(tx_hashes, return_exceptions=False):
+    """Fetch several transactions concurrently, in the order of ``tx_hashes``"""
+    return await _gather([_get_tx_info(tx_hash) for tx_hash in tx_hashes], return_exceptions=return_exceptions)
+
+async def _query_contract(contract_addr, query_msg):
     try:
-        terra = AsyncLCDClient("https://bombay-lcd.terra.dev", "bombay-12")
-        response = await terra.wasm.contract_query(contract_addr, query_msg)
+        response = await pool.call(lambda terra: terra.wasm.contract_query(contract_addr, query_msg), hedge=True)
         return response
     except Exception as e:
-        raise serializers.ValidationError('Failed to retrieve information from the blockchain: ' + str(e))
\ No newline at end of file
+        raise serializers.ValidationError('Failed to retrieve information from the blockchain: ' + str(e))
+
+# Upstream queries in flight on the pool loop, keyed by query_key
+_in_flight = {}
+
+async def _single_flight_query_contract(contract_addr, query_msg):
+    """Share one upstream query, and its result or error, between identical concurrent callers"""
+    key = query_key(contract_addr, query_msg)
+    task = _in_flight.get(key)
+    if task is not None:
+        metrics.incr('terra.queries.coalesced')
+    else:
+        metrics.incr('terra.queries.upstream')
+        task = asyncio.ensure_future(_query_contract(contract_addr, query_msg))
+        _in_flight[key] = task
+        task.add_done_callback(lambda done: _in_flight.pop(key) if _in_flight.get(key) is done else None)
+    # A cancelled caller must not cancel the query the other callers wait on
+    return await asyncio.shield(task)
+
+async def _cached_query_contract(contract_addr, query_msg):
+    if not chain_cache.get_ttl(query_msg):
+        return await _single_flight_query_contract(contract_addr, query_msg)
+    # Cache I/O runs in a worker thread, off the pool loop every chain query shares
+    hit, response = await asyncio.to_thread(chain_cache.get, contract_addr, query_msg)
+    if hit:
+        return response
+    response = await _single_flight_query_contract(contract_addr, query_msg)
+    await asyncio.to_thread(chain_cache.set, contract_addr, query_msg, response)
+    return response
+
+query_contract = on_pool(_cached_query_contract)
+
+@on_pool
+async def query_contract_many(queries, return_exceptions=False, cache=True):
+    """Run several (contract_addr, query_msg) queries concurrently.
+
+    Results are returned in the order of ``queries``. At most
+    TERRA_LCD['MAX_CONCURRENCY'] queries are in flight at once. With
+    ``return_exceptions`` a failed query yields its ValidationError in place
+    of a result instead of failing the whole batch. Without ``cache`` every
+    query goes to the chain.
+    """
+    query = _cached_query_contract if cache else _single_flight_query_contract
+    return await _gather(
+        [query(contract_addr, query_msg) for contract_addr, query_msg in queries],
+        return_exceptions=return_exceptions
+    )
+
+def _tokens_query(owner, start_after):
+    name = 'tokens' if owner is not None else 'all_tokens'
+    query = { name:{ "limit": TOKENS_PAGE_LIMIT}}
+    if owner is not None:
+        query[name]['owner'] = owner
+    if start_after is not None:
+        query[name]['start_after'] = start_after
+    return query
+
+def _next_page(response, remaining):
+    """Trim a tokens response to ``remaining`` ids. Returns (page, remaining, has_more)."""
+    page = response['tokens']
+    if remaining is not None:
+        page = page[:remaining]
+        remaining -= len(page)
+    return page, remaining, bool(page) and remaining != 0
+
+def iter_token_pages(contract_addr, owner=None, start_after=None, max_tokens=None):
+    """Yield the token ids of a CW721 contract page by page, following start_after.
+
+    Lists the tokens of ``owner`` if given, otherwise all tokens. The next
+    page is already being fetched while the caller processes the current
+    one. Stops at the first empty page, or after ``max_tokens`` token ids.
+    """
+    remaining = max_tokens
+    future = pool.submit(_single_flight_query_contract(contract_addr, _tokens_query(owner, start_after)))
+    while future is not None:
+        page, remaining, has_more = _next_page(future.result(), remaining)
+        future = None
+        if has_more:
+            future = pool.submit(_single_flight_query_contract(contract_addr, _tokens_query(owner, page[-1])))
+        if page:
+            yield page
+
+async def aiter_token_pages(contract_addr, owner=None, start_after=None, max_tokens=None):
+    """Async counterpart of iter_token_pages for callers running on their own event loop"""
+    remaining = max_tokens
+    future = pool.submit(_single_flight_query_contract(contract_addr, _tokens_query(owner, start_after)))
+    while future is not None:
+        page, remaining, has_more = _next_page(await asyncio.wrap_future(future), remaining)
+        future = None
+        if has_more:
+            future = pool.submit(_single_flight_query_contract(contract_addr, _tokens_query(owner, page[-1])))
+        if page:
+            yield page
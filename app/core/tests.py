@@ -0,0 +1,270 @@
+import asyncio
+import json
+import random
+import shutil
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
+
+from django.conf import settings
+from django.test import SimpleTestCase, override_settings
+from rest_framework import serializers
+
+from core import chain_cache
+from core import lcd
+from core import terra
+from core import utils
+
+
+class IterJsonArrayTests(SimpleTestCase):
+    """Streaming parser of the provider feeds"""
+
+    DATA = [
+        1.5, -2e-3, -0.25e+10, 0, 12345678901234567890, True, False, None,
+        'x,]"', 'é', [], {}, {'a': 'b]', 'c': [1, 2, {'d': None}]},
+    ]
+
+    def parse(self, chunks):
+        return list(utils.iter_json_array(chunks))
+
+    def test_random_chunk_boundaries(self):
+        raw = json.dumps(self.DATA, ensure_ascii=False).encode()
+        rng = random.Random(0)
+        for _ in range(500):
+            cuts = sorted(rng.sample(range(1, len(raw)), rng.randint(0, 30)))
+            chunks = [raw[start:end] for start, end in zip([0] + cuts, cuts + [len(raw)])]
+            self.assertEqual(self.parse(chunks), self.DATA, chunks)
+
+    def test_every_single_split(self):
+        raw = json.dumps(self.DATA, ensure_ascii=False).encode()
+        for cut in range(1, len(raw)):
+            self.assertEqual(self.parse([raw[:cut], raw[cut:]]), self.DATA, cut)
+
+    def test_numbers_split_across_chunks(self):
+        self.assertEqual(self.parse([b'[1.', b'5]']), [1.5])
+        self.assertEqual(self.parse([b'[1e', b'3, -', b'2, 1', b'0]']), [1000.0, -2, 10])
+        self.assertEqual(self.parse([b'[-0.2', b'5E+', b'1]']), [-2.5])
+
+    def test_reads_the_stream_to_the_end(self):
+        consumed = []
+
+        def chunks():
+            for chunk in [b'[1, 2]', b'  ', b'\n']:
+                consumed.append(chunk)
+                yield chunk
+
+        self.assertEqual(self.parse(chunks()), [1, 2])
+        self.assertEqual(len(consumed), 3)
+
+    def test_invalid_documents(self):
+        for chunks in ([b'[1] x'], [b'[1]', b'[2]'], [b'[1'], [b'[1,]'], [b'{}'], [b'[1 2]']):
+            with self.assertRaises(ValueError, msg=chunks):
+                self.parse(chunks)
+
+
+class ChainCacheTests(SimpleTestCase):
+    QUERY = {'nft_info': {'token_id': '1'}}
+
+    def setUp(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir, ignore_errors=True)
+        # A shared backend that needs no server, in place of memcached
+        chain = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': cache_dir}
+        cache = override_settings(CACHES=dict(settings.CACHES, chain=chain))
+        cache.enable()
+        self.addCleanup(cache.disable)
+
+    def test_invalidate_drops_the_contract_queries(self):
+        chain_cache.set('terra1a', self.QUERY, {'owner': 'x'})
+        chain_cache.set('terra1b', self.QUERY, {'owner': 'y'})
+        self.assertEqual(chain_cache.get('terra1a', self.QUERY), (True, {'owner': 'x'}))
+
+        chain_cache.invalidate('terra1a')
+        self.assertEqual(chain_cache.get('terra1a', self.QUERY), (False, None))
+        self.assertEqual(chain_cache.get('terra1b', self.QUERY), (True, {'owner': 'y'}))
+
+    def test_evicted_version_does_not_revive_invalidated_queries(self):
+        chain_cache.set('terra1a', self.QUERY, {'owner': 'x'})
+        chain_cache.invalidate('terra1a')
+        chain_cache.set('terra1a', self.QUERY, {'owner': 'y'})
+        self.assertEqual(chain_cache.get('terra1a', self.QUERY), (True, {'owner': 'y'}))
+
+        chain_cache.get_cache().delete('version:terra1a')
+        self.assertEqual(chain_cache.get('terra1a', self.QUERY), (False, None))
+
+    def test_process_local_cache_cannot_be_invalidated(self):
+        local = dict(settings.CACHES['chain'], BACKEND='django.core.cache.backends.locmem.LocMemCache')
+        with override_settings(CACHES=dict(settings.CACHES, chain=local)):
+            self.assertFalse(chain_cache.is_shared())
+            with self.assertRaises(chain_cache.ProcessLocalCache):
+                chain_cache.invalidate('terra1a')
+
+
+class LCDStub:
+    """A local LCD node answering every request with ``status`` after ``delay`` seconds.
+
+    Contract queries are answered by ``contract(query_msg)`` if given.
+    """
+
+    def __init__(self, status=200, delay=0, contract=None):
+        self.status = status
+        self.delay = delay
+        self.contract = contract
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.requests.append(self.path)
+                time.sleep(stub.delay)
+                if stub.status != 200:
+                    body = {'error': 'node error'}
+                elif self.path.startswith('/wasm/') and stub.contract is not None:
+                    query_msg = json.loads(parse_qs(urlsplit(self.path).query)['query_msg'][0])
+                    body = {'height': '7', 'result': stub.contract(query_msg)}
+                elif self.path.startswith('/wasm/'):
+                    body = {'height': '7', 'result': {'owner': 'terra1owner'}}
+                else:
+                    body = {'block': {'header': {'height': '7'}}}
+                body = json.dumps(body).encode()
+                try:
+                    self.send_response(stub.status)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client gave up on this node (a lost hedge)
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:%d' % self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class LCDTestCase(SimpleTestCase):
+    LCD = {'FAILURE_THRESHOLD': 2, 'RECOVERY_TIMEOUT': 0.5, 'HEDGE_AFTER': 0}
+
+    def use_lcd(self, *stubs, **config):
+        """Send chain queries to ``stubs``, in that order of preference, through a fresh pool"""
+        for stub in stubs:
+            self.addCleanup(stub.close)
+        pool = lcd.LCDClientPool()
+        self.addCleanup(pool.close)
+        for module in (lcd, terra):
+            patcher = mock.patch.object(module, 'pool', pool)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        urls = [stub.url for stub in stubs]
+        lcd_config = override_settings(TERRA_LCD=dict(settings.TERRA_LCD, URLS=urls, **dict(self.LCD, **config)))
+        lcd_config.enable()
+        self.addCleanup(lcd_config.disable)
+        return pool
+
+
+class LCDFailoverTests(LCDTestCase):
+
+    def test_failover_and_circuit_breaker(self):
+        failing, healthy = LCDStub(status=503), LCDStub()
+        self.use_lcd(failing, healthy)
+
+        for _ in range(4):
+            self.assertEqual(terra.get_latest_block_height(), '7')
+        # The breaker opened after FAILURE_THRESHOLD failures in a row
+        self.assertEqual(len(failing.requests), 2)
+        self.assertEqual(len(healthy.requests), 4)
+
+        # Half-open after RECOVERY_TIMEOUT: one probe, which fails and reopens it
+        time.sleep(0.6)
+        self.assertEqual(terra.get_latest_block_height(), '7')
+        self.assertEqual(terra.get_latest_block_height(), '7')
+        self.assertEqual(len(failing.requests), 3)
+
+    def test_every_endpoint_failing(self):
+        self.use_lcd(LCDStub(status=503), LCDStub(status=503))
+
+        for _ in range(2):
+            with self.assertRaisesRegex(serializers.ValidationError, '503'):
+                terra.get_latest_block_height()
+        with self.assertRaisesRegex(serializers.ValidationError, 'Every LCD endpoint is failing'):
+            terra.get_latest_block_height()
+
+    def test_query_errors_do_not_fail_over(self):
+        missing, healthy = LCDStub(status=404), LCDStub()
+        self.use_lcd(missing, healthy)
+
+        with self.assertRaisesRegex(serializers.ValidationError, 'node error'):
+            terra.get_latest_block_height()
+        self.assertEqual(len(missing.requests), 1)
+        self.assertEqual(healthy.requests, [])
+
+    def test_slow_reads_are_hedged(self):
+        slow, fast = LCDStub(delay=2), LCDStub()
+        self.use_lcd(slow, fast, HEDGE_AFTER=0.1)
+
+        start = time.monotonic()
+        self.assertEqual(terra.get_latest_block_height(), '7')
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual((len(slow.requests), len(fast.requests)), (1, 1))
+
+
+class SingleFlightTests(LCDTestCase):
+    QUERY = {'owner_of': {'token_id': '1'}}
+
+    def test_identical_concurrent_queries_share_one_request(self):
+        node = LCDStub(delay=0.3)
+        self.use_lcd(node)
+
+        responses = terra.query_contract_many([('terra1a', self.QUERY)] * 5 + [('terra1b', self.QUERY)])
+        self.assertEqual(responses, [{'owner': 'terra1owner'}] * 6)
+        self.assertEqual(len(node.requests), 2)
+        self.assertEqual(terra._in_flight, {})
+
+    def test_errors_are_shared_too(self):
+        node = LCDStub(status=404, delay=0.3)
+        self.use_lcd(node)
+
+        responses = terra.query_contract_many([('terra1a', self.QUERY)] * 5, return_exceptions=True)
+        self.assertTrue(all(isinstance(response, serializers.ValidationError) for response in responses))
+        self.assertEqual(len(node.requests), 1)
+
+
+class TokenPagesTests(LCDTestCase):
+    TOKENS = ['%03d' % i for i in range(25)]
+
+    def capped_contract(self, query_msg):
+        """all_tokens of a contract that returns at most 10 ids per page"""
+        query = query_msg['all_tokens']
+        start_after = query.get('start_after')
+        tokens = [token_id for token_id in self.TOKENS if start_after is None or token_id > start_after]
+        return {'tokens': tokens[:min(query['limit'], 10)]}
+
+    def test_short_pages_do_not_end_the_listing(self):
+        node = LCDStub(contract=self.capped_contract)
+        self.use_lcd(node)
+
+        pages = list(terra.iter_token_pages('terra1a'))
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+        self.assertEqual([token_id for page in pages for token_id in page], self.TOKENS)
+        # The listing ends at the first empty page
+        self.assertEqual(len(node.requests), 4)
+
+    def test_max_tokens(self):
+        node = LCDStub(contract=self.capped_contract)
+        self.use_lcd(node)
+
+        async def tokens():
+            return [token_id async for page in terra.aiter_token_pages('terra1a', start_after='004', max_tokens=15) for token_id in page]
+
+        self.assertEqual(asyncio.run(tokens()), self.TOKENS[5:20])
+        self.assertEqual(len(node.requests), 2)
@@ -1,6 +1,92 @@
+import codecs
+import json
+import re
+import unicodedata
+from itertools import islice
 
 from django.conf import settings
 
+_decoder = json.JSONDecoder()
+
+NUMBER_CHARS = set('0123456789+-.eE')
+
+def iter_json_array(chunks):
+  """Yield the items of a JSON array read from an iterable of byte chunks.
+
+  Only the item being parsed is held in memory, so arbitrarily large arrays
+  can be processed while they are downloaded. The chunks after the closing
+  bracket are still read, so a caller that consumes every item also
+  consumes the whole stream; anything but whitespace there is an error.
+  """
+  decoder = codecs.getincrementaldecoder('utf-8')()
+  chunks = iter(chunks)
+  buffer = ''
+  position = 0
+  state = 'start'
+  finished = False
+
+  while True:
+    while position < len(buffer) and buffer[position].isspace():
+      position += 1
+    if position < len(buffer):
+      char = buffer[position]
+      if state == 'end':
+        raise ValueError(f'Unexpected data after the JSON array at position {position}')
+      if state == 'start':
+        if char != '[':
+          raise ValueError('Expected a JSON array')
+        state = 'first'
+        position += 1
+        continue
+      if state in ('first', 'after') and char == ']':
+        state = 'end'
+        position += 1
+        continue
+      if state == 'after':
+        if char != ',':
+          raise ValueError(f'Expected "," or "]" at position {position}')
+        state = 'item'
+        position += 1
+        continue
+      try:
+        item, end = _decoder.raw_decode(buffer, position)
+      except json.JSONDecodeError:
+        if finished:
+          raise
+      else:
+        # A number running up to the end of the buffer may continue in the next chunk
+        number_end = end
+        if char in NUMBER_CHARS:
+          while number_end < len(buffer) and buffer[number_end] in NUMBER_CHARS:
+            number_end += 1
+        if number_end < len(buffer) or finished:
+          yield item
+          position = end
+          state = 'after'
+          continue
+    if finished:
+      if state == 'end':
+        return
+      raise ValueError('Unexpected end of JSON array')
+
+    buffer = buffer[position:]
+    position = 0
+    chunk = next(chunks, None)
+    if chunk is None:
+      buffer += decoder.decode(b'', final=True)
+      finished = True
+    else:
+      buffer += decoder.decode(chunk)
+
+def chunked(iterable, size):
+  """Yield lists of up to ``size`` consecutive items of ``iterable``"""
+  iterator = iter(iterable)
+  while True:
+    chunk = list(islice(iterator, size))
+    if not chunk:
+      return
+    yield chunk
+
 def parse_team_list_data(data):
   teams = []
   for team in data:
@@ -11,11 +97,11 @@ def parse_team_list_data(data):
     })
   return teams
 
-def parse_athlete_list_data(data):
-  athletes = []
+def iter_athlete_data(data):
+  """Map active players of the SportsData Players feed, one at a time"""
   for athlete in data:
     if athlete.get('Status') == "Active":
-      athletes.append({
+      yield {
         'first_name': athlete.get('FirstName'),
         'last_name': athlete.get('LastName'),
         'api_id': athlete.get('PlayerID'),
@@ -25,39 +111,74 @@ def parse_athlete_list_data(data):
         'jersey': athlete.get('Jersey'),
         'is_active': athlete.get('Status'),
         'is_injured': athlete.get('InjuryStatus')
-      })
-  return athletes
+      }
 
-def filter_athlete_data(data, participant):
-  athlete_list = data.get('league').get('players')
-  for athlete in athlete_list:
+def parse_athlete_list_data(data):
+  return list(iter_athlete_data(data))
+
+NAME_SUFFIXES = {'jr', 'sr', 'ii', 'iii', 'iv', 'v'}
+
+def normalize_name(first_name, last_name):
+  """Case, accent and suffix insensitive form of a player name: 'Luka Dončić Jr.' -> 'luka doncic'"""
+  name = unicodedata.normalize('NFKD', f'{first_name or ""} {last_name or ""}')
+  name = ''.join(char for char in name if not unicodedata.combining(char)).lower()
+  words = re.sub(r"[^a-z0-9 ]", ' ', name.replace("'", '').replace('.', '')).split()
+  while len(words) > 1 and words[-1] in NAME_SUFFIXES:
+    words.pop()
+  return ' '.join(words)
+
+def _athlete_info(athlete, participant):
+  return {
+    'first_name': athlete.get('firstName'),
+    'last_name': athlete.get('lastName'),
+    'terra_id': participant.get('terra_id'),
+    'api_id': athlete.get('playerId'),
+    'team': athlete.get('team').get('teamId'),
+    'positions': athlete.get('positions'),
+    'is_active': athlete.get('isActive'),
+    'is_injured': athlete.get('isInjured'),
+    'is_suspended': athlete.get('isSuspended')
+  }
+
+class PlayerIndex:
+  """Players of a Stats Perform league feed, indexed by playerId and by normalized name.
+
+  Build it once per feed payload and resolve any number of participants
+  against it in constant time each. A name shared by several players is
+  ambiguous and only matches by api_id.
+  """
+
+  def __init__(self, data):
+    self.by_id = {}
+    self.by_name = {}
+    for athlete in data.get('league').get('players'):
+      self.by_id[athlete.get('playerId')] = athlete
+      self.by_name.setdefault(normalize_name(athlete.get('firstName'), athlete.get('lastName')), []).append(athlete)
+
+  def find(self, participant):
+    """The player matching a participant's api_id, or else its first and last name. None if there is none."""
     if participant.get('api_id', None) is not None:
-      if athlete.get('playerId') == participant.get('api_id'):
-        return {
-          'first_name': player.get('firstName'),
-          'last_name': player.get('lastName'),
-          'terra_id': participant.get('terra_id'),
-          'api_id': player.get('playerId'),
-          'team': player.get('team').get('teamId'),
-          'positions': player.get('positions'),
-          'is_active': player.get('isActive'),
-          'is_injured': player.get('isInjured'),
-          'is_suspended': player.get('isSuspended')
-        }
-    else:
-      if player.get('firstName', '').lower() == participant.get('first_name').lower() and player.get('lastName', '').lower() == participant.get('last_name').lower():
-        return {
-          'first_name': player.get('firstName'),
-          'last_name': player.get('lastName'),
-          'terra_id': participant.get('terra_id'),
-          'api_id': player.get('playerId'),
-          'team': player.get('team').get('teamId'),
-          'positions': player.get('positions'),
-          'is_active': player.get('isActive'),
-          'is_injured': player.get('isInjured'),
-          'is_suspended': player.get('isSuspended')
-        }
-  raise Exception("No matching data found")
+      return self.by_id.get(participant.get('api_id'))
+    athletes = self.by_name.get(normalize_name(participant.get('first_name'), participant.get('last_name')), [])
+    return athletes[0] if len(athletes) == 1 else None
+
+  def resolve(self, participants):
+    """Match participants in one pass. Returns (matches, misses): athlete data per matched participant, and the unmatched participants."""
+    matches = []
+    misses = []
+    for participant in participants:
+      athlete = self.find(participant)
+      if athlete is None:
+        misses.append(participant)
+      else:
+        matches.append(_athlete_info(athlete, participant))
+    return matches, misses
+
+def filter_athlete_data(data, participant):
+  athlete = PlayerIndex(data).find(participant)
+  if athlete is None:
+    raise Exception("No matching data found")
+  return _athlete_info(athlete, participant)
 
 def parse_athlete_season_data(data, participant):
   athlete_season_data = data.get('league').get('players')[0].get('seasons')[0]
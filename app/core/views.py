@@ -0,0 +1,56 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from rest_framework import status, generics
+from rest_framework.response import Response
+from rest_framework.permissions import IsAdminUser
+
+from core import metrics
+
+class MetricsView(generics.GenericAPIView):
+    """Counters and timings collected by this worker process"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(metrics.snapshot(), status=status.HTTP_200_OK)
+
+class AsyncDispatchMixin:
+    """Lets API views and viewsets define coroutine handlers.
+
+    Coroutine handlers are awaited on the server's event loop under ASGI (and
+    through async_to_sync under WSGI). DRF's request setup, which may hit the
+    database to authenticate, and any remaining sync handlers run through
+    sync_to_async.
+    """
+
+    @classmethod
+    def as_view(cls, *args, **initkwargs):
+        view = super().as_view(*args, **initkwargs)
+        # Mark the view as a coroutine function, the way Django does for async views
+        view._is_coroutine = asyncio.coroutines._is_coroutine
+        return view
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+
+            if asyncio.iscoroutinefunction(handler):
+                response = await handler(request, *args, **kwargs)
+            else:
+                response = await sync_to_async(handler)(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
@@ -0,0 +1,116 @@
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+import aiohttp
+from django.conf import settings
+
+from core import fixtures
+from core import metrics
+from fantasy import client
+from fantasy import rate_limit
+
+# Async counterpart of fantasy.client, for syncs that need many provider
+# endpoints (per team, per game). The requests of a batch run concurrently,
+# at most PROVIDER_HTTP['FAN_OUT'] at a time, each within its own deadline,
+# so the batch takes about as long as its slowest request. Retries, backoff
+# and the shared rate limit work as in fantasy.client, except that waits for
+# a token never outlast the request's deadline.
+
+class HTTPStatusError(Exception):
+  """Raised for a non-2xx provider response that is not retried (any more)"""
+
+  def __init__(self, status, reason, url):
+    super().__init__(f'{status} Error: {reason} for url: {url}')
+    self.status = status
+
+def _session():
+  config = settings.PROVIDER_HTTP
+  session = aiohttp.ClientSession(
+    connector=aiohttp.TCPConnector(limit=config['POOL_SIZE']),
+    timeout=aiohttp.ClientTimeout(connect=config['CONNECT_TIMEOUT'], sock_read=config['READ_TIMEOUT']),
+  )
+  return fixtures.AsyncSession(session) if fixtures.get_mode() else session
+
+async def _get(session, url, params, auth, priority, deadline_at):
+  config = settings.PROVIDER_HTTP
+  host = urlsplit(url).netloc
+  prefix = 'provider.' + host
+  attempt = 0
+  while True:
+    request_params = dict(params or {})
+    if auth is not None:
+      request_params.update(auth())
+    if host in settings.PROVIDER_RATE_LIMIT['BUCKETS']:
+      # The token is taken in the event loop (a short flocked file update) so
+      # that a request timed out while waiting never takes one afterwards
+      max_wait = min(settings.PROVIDER_RATE_LIMIT['PRIORITIES'][priority]['MAX_WAIT'], deadline_at - time.monotonic())
+      await rate_limit.aacquire(host, priority, max_wait)
+
+    start = time.monotonic()
+    metrics.incr(prefix + '.requests')
+    response = None
+    try:
+      async with session.get(url, params=request_params) as response:
+        metrics.observe(prefix + '.request_seconds', time.monotonic() - start)
+        if 200 <= response.status < 300:
+          return await response.json(content_type=None)
+        if response.status not in client.RETRY_STATUSES or attempt >= config['MAX_RETRIES']:
+          metrics.incr(prefix + '.errors')
+          raise HTTPStatusError(response.status, response.reason, url)
+    except (asyncio.TimeoutError, aiohttp.ClientConnectionError):
+      if attempt >= config['MAX_RETRIES']:
+        metrics.incr(prefix + '.errors')
+        raise
+      response = None
+    metrics.incr(prefix + '.errors')
+    if response is not None and response.status == 429:
+      rate_limit.drain(host)
+
+    metrics.incr(prefix + '.retries')
+    await asyncio.sleep(client.backoff(attempt, response))
+    attempt += 1
+
+async def aget_many(urls, params=None, auth=None, priority=rate_limit.SYNC, deadline=None, concurrency=None, return_exceptions=False):
+  """GET ``urls`` concurrently and return their decoded JSON bodies, in order.
+
+  At most ``concurrency`` (PROVIDER_HTTP['FAN_OUT']) requests are in flight;
+  each gets ``deadline`` (PROVIDER_HTTP['DEADLINE']) seconds, retries
+  included, before asyncio.TimeoutError. With ``return_exceptions`` a failed
+  request puts its exception in the results instead of raising it.
+  """
+  config = settings.PROVIDER_HTTP
+  semaphore = asyncio.Semaphore(concurrency or config['FAN_OUT'])
+  deadline = deadline or config['DEADLINE']
+
+  async def get(session, url):
+    async with semaphore:
+      return await asyncio.wait_for(_get(session, url, params, auth, priority, time.monotonic() + deadline), deadline)
+
+  start = time.monotonic()
+  session = _session()
+  try:
+    return await asyncio.gather(*[get(session, url) for url in urls], return_exceptions=return_exceptions)
+  finally:
+    await session.close()
+    metrics.observe('provider.fan_out_seconds', time.monotonic() - start)
+
+def get_many(urls, **kwargs):
+  """Blocking aget_many, for sync code that is not running in an event loop.
+
+  It runs the batch in a new event loop (asyncio.run), which raises
+  RuntimeError inside a running one: coroutines await aget_many instead.
+  """
+  return asyncio.run(aget_many(urls, **kwargs))
+
+def describe_error(url, error):
+  """The error message fantasy.requests reports for a failed request"""
+  if isinstance(error, rate_limit.RateLimitExceeded):
+    return f'{error} when downloading: {url}'
+  if isinstance(error, asyncio.TimeoutError):
+    return f'HTTP timeout when downloading: {url}'
+  if isinstance(error, aiohttp.ClientConnectionError):
+    return f'HTTP Connection Error when downloading: {url}'
+  if isinstance(error, HTTPStatusError):
+    return f'HTTP error occurred: {error}'
+  return f'Failed to download {url}: {error!r}'
@@ -0,0 +1,147 @@
+from datetime import timedelta
+from decimal import Decimal
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from core import metrics
+from fantasy import models
+from fantasy import rate_limit
+from fantasy import requests
+
+# Live box scores of the games behind running fantasy games. A GameSchedule
+# with a SportsData api_id is polled from its start time until SportsData
+# reports the game over, and its next poll is set from the game state. The box
+# scores of the due games are fetched concurrently, and the fantasy scores of
+# the game's athletes are upserted into GameAthleteStat in bulk. It runs in
+# its own process (manage.py poll_box_scores), so long roster syncs never
+# hold back live scores.
+
+FINAL_STATUSES = ['Final', 'F/OT', 'Canceled', 'Postponed', 'Forfeit', 'NotNecessary']
+LIVE_STATUSES = ['InProgress']
+BREAK_QUARTERS = ['Half']
+
+def _started(now):
+  return models.GameSchedule.objects.filter(api_id__isnull=False, datetime__lte=now).exclude(status__in=FINAL_STATUSES)
+
+def fetch_box_scores(schedules):
+  """Fetch the box scores of ``schedules`` concurrently, in the same order"""
+  return requests.get_many(
+    ['stats/json/BoxScore/' + str(schedule.api_id) for schedule in schedules],
+    priority=rate_limit.LIVE,
+    concurrency=settings.LIVE_STATS['CONCURRENCY']
+  )
+
+def fantasy_score(line, stats_info):
+  """Score of a PlayerGame stat line: the active StatsInfo multipliers, or SportsData's FantasyPoints without any"""
+  if not stats_info:
+    score = Decimal(str(line.get('FantasyPoints') or 0))
+  else:
+    score = sum((Decimal(str(line.get(stat.key) or 0)) * stat.multiplier for stat in stats_info), Decimal(0))
+  return score.quantize(Decimal('0.01'))
+
+def next_poll_at(game, now, spacing):
+  """When to poll a game again given its box score Game, None once it is over"""
+  config = settings.LIVE_STATS
+  if game.get('Status') in FINAL_STATUSES:
+    return None
+  if game.get('Status') in LIVE_STATUSES:
+    interval = config['BREAK_INTERVAL'] if game.get('Quarter') in BREAK_QUARTERS else config['LIVE_INTERVAL']
+  else:
+    # Past the scheduled start but not tipped off, delayed or suspended
+    interval = config['PREGAME_INTERVAL']
+  return now + timedelta(seconds=max(interval, spacing))
+
+def save_box_scores(box_scores, stats_info):
+  """Upsert the fantasy scores of [(schedule, box score)] pairs. Returns (created, updated)."""
+  lines = {}
+  schedules = {}
+  for schedule, box_score in box_scores:
+    lines[schedule.pk] = {line['PlayerID']: line for line in box_score.get('PlayerGames') or [] if line.get('PlayerID') is not None}
+    schedules.setdefault(schedule.game_id, []).append(schedule)
+  # Only (game, player) pairs of this batch, not every combination of its games and players
+  pairs = [
+    Q(game_id=schedule.game_id, athlete__api_id__in=lines[schedule.pk])
+    for schedule, box_score in box_scores if lines[schedule.pk]
+  ]
+  if not pairs:
+    return [], []
+  game_athletes = list(models.GameAthlete.objects.filter(reduce(or_, pairs)).values_list('id', 'game_id', 'athlete__api_id'))
+
+  now = timezone.now()
+  with transaction.atomic():
+    stats = {
+      stat.game_athlete_id: stat
+      for stat in models.GameAthleteStat.objects.select_for_update().filter(game_athlete_id__in=[row[0] for row in game_athletes])
+    }
+    created = []
+    updated = []
+    for game_athlete_id, game_id, api_id in game_athletes:
+      schedule = next((schedule for schedule in schedules[game_id] if api_id in lines[schedule.pk]), None)
+      if schedule is None:
+        continue
+      line = lines[schedule.pk][api_id]
+      score = fantasy_score(line, stats_info)
+      stat = stats.get(game_athlete_id)
+      if stat is None:
+        created.append(models.GameAthleteStat(game_athlete_id=game_athlete_id, game_schedule=schedule, fantasy_score=score))
+      elif stat.fantasy_score != score:
+        stat.fantasy_score = score
+        stat.updated_at = now
+        updated.append(stat)
+    models.GameAthleteStat.objects.bulk_create(created)
+    models.GameAthleteStat.objects.bulk_update(updated, ['fantasy_score', 'updated_at'])
+  return created, updated
+
+def run_once():
+  """Poll the box scores of the started games that are due. Returns the counts of the run."""
+  now = timezone.now()
+  # Stretch the poll intervals so that every live game together stays within the provider rate limit
+  live = _started(now).count()
+  spacing = live * 60 / settings.LIVE_STATS['MAX_REQUESTS_PER_MINUTE']
+  metrics.gauge('box_scores.live_games', live)
+  metrics.gauge('box_scores.poll_spacing_seconds', spacing)
+
+  due = list(_started(now).filter(Q(next_poll_at__isnull=True) | Q(next_poll_at__lte=now)).order_by('next_poll_at'))
+  if not due:
+    return {'polled': 0, 'failed': 0, 'created': 0, 'updated': 0}
+
+  responses = fetch_box_scores(due)
+  now = timezone.now()
+  box_scores = []
+  failed = 0
+  for schedule, response in zip(due, responses):
+    schedule.updated_at = now
+    if response['status'] != settings.RESPONSE['STATUS_OK'] or not response['response']:
+      failed += 1
+      schedule.next_poll_at = now + timedelta(seconds=max(settings.LIVE_STATS['LIVE_INTERVAL'], spacing))
+      continue
+    game = response['response'].get('Game') or {}
+    schedule.status = game.get('Status') or schedule.status
+    schedule.next_poll_at = next_poll_at(game, now, spacing)
+    box_scores.append((schedule, response['response']))
+
+  stats_info = list(models.StatsInfo.objects.filter(is_active=True))
+  created, updated = save_box_scores(box_scores, stats_info)
+  models.GameSchedule.objects.bulk_update(due, ['status', 'next_poll_at', 'updated_at'])
+
+  metrics.incr('box_scores.polls', len(due))
+  metrics.incr('box_scores.errors', failed)
+  return {'polled': len(due), 'failed': failed, 'created': len(created), 'updated': len(updated)}
+
+def seconds_until_due(now=None):
+  """Seconds until the next game is due for a poll, None if no game is scheduled"""
+  now = now or timezone.now()
+  upcoming = models.GameSchedule.objects.filter(api_id__isnull=False).exclude(status__in=FINAL_STATUSES)
+  next_start = upcoming.filter(datetime__gt=now).order_by('datetime').values_list('datetime', flat=True).first()
+  next_poll = _started(now).filter(next_poll_at__isnull=False).order_by('next_poll_at').values_list('next_poll_at', flat=True).first()
+  if _started(now).filter(next_poll_at__isnull=True).exists():
+    return 0
+  due = [at for at in (next_start, next_poll) if at is not None]
+  if not due:
+    return None
+  return max((min(due) - now).total_seconds(), 0)
@@ -0,0 +1,99 @@
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+from core import fixtures
+from core import metrics
+from fantasy import rate_limit
+
+# HTTP client shared by the sports data provider modules. Each worker process
+# keeps one requests.Session, so connections to a provider are reused across
+# calls instead of being opened for every request.
+
+RETRY_STATUSES = [429, 500, 502, 503, 504]
+
+_lock = threading.Lock()
+_session = None
+_pid = None
+
+def get_session():
+  global _session, _pid
+  if _pid != os.getpid():
+    with _lock:
+      if _pid != os.getpid():
+        # Never share pooled sockets with a forked parent
+        config = settings.PROVIDER_HTTP
+        session = requests.Session()
+        adapter_class = fixtures.RequestsAdapter if fixtures.get_mode() else HTTPAdapter
+        adapter = adapter_class(pool_connections=config['POOL_SIZE'], pool_maxsize=config['POOL_SIZE'])
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        _session = session
+        _pid = os.getpid()
+  return _session
+
+def backoff(attempt, response=None):
+  """Seconds to wait before retry number ``attempt``: Retry-After if given, else full jitter"""
+  config = settings.PROVIDER_HTTP
+  retry_after = response.headers.get('Retry-After') if response is not None else None
+  if retry_after and retry_after.isdigit():
+    return min(float(retry_after), config['BACKOFF_MAX'])
+  return random.uniform(0, min(config['BACKOFF_BASE'] * 2 ** attempt, config['BACKOFF_MAX']))
+
+def get(url, params=None, auth=None, headers=None, stream=False, priority=rate_limit.SYNC):
+  """GET ``url`` through the shared session with timeouts and bounded retries.
+
+  ``auth`` is called before every attempt and its result added to the query
+  parameters, so timestamped signatures are fresh on retries. Once retries
+  are exhausted the last response is returned, or the last
+  requests.Timeout/ConnectionError raised, as with requests.get.
+
+  Every attempt takes a token from the host's shared rate limit bucket at
+  ``priority``, and rate_limit.RateLimitExceeded is raised if none frees up.
+  """
+  config = settings.PROVIDER_HTTP
+  host = urlsplit(url).netloc
+  prefix = 'provider.' + host
+  attempt = 0
+  while True:
+    request_params = dict(params or {})
+    if auth is not None:
+      request_params.update(auth())
+
+    rate_limit.acquire(host, priority)
+    start = time.monotonic()
+    metrics.incr(prefix + '.requests')
+    try:
+      response = get_session().get(
+        url,
+        params=request_params,
+        headers=headers,
+        stream=stream,
+        timeout=(config['CONNECT_TIMEOUT'], config['READ_TIMEOUT'])
+      )
+    except (requests.Timeout, requests.exceptions.ConnectionError):
+      metrics.incr(prefix + '.errors')
+      if attempt >= config['MAX_RETRIES']:
+        raise
+      response = None
+    else:
+      metrics.observe(prefix + '.request_seconds', time.monotonic() - start)
+      if response.status_code not in RETRY_STATUSES:
+        return response
+      if response.status_code == 429:
+        # The provider's quota is spent: make the other workers wait too
+        rate_limit.drain(host)
+      metrics.incr(prefix + '.errors')
+      if attempt >= config['MAX_RETRIES']:
+        return response
+      response.close()
+
+    metrics.incr(prefix + '.retries')
+    time.sleep(backoff(attempt, response))
+    attempt += 1
@@ -0,0 +1,105 @@
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+from django.conf import settings
+
+from core import metrics
+from fantasy import client
+from fantasy import rate_limit
+
+CHUNK_SIZE = 64 * 1024
+
+# Provider responses are kept on disk under PROVIDER_CACHE['DIR'], one file
+# per URL and parameters: a JSON line with the ETag, Last-Modified and fetch
+# time, followed by the gzipped body. Auth parameters are not part of the key.
+
+def get_max_age(endpoint):
+  config = settings.PROVIDER_CACHE
+  return config['MAX_AGE'].get(endpoint, config['DEFAULT_MAX_AGE'])
+
+def _path(url, params):
+  digest = hashlib.sha1(json.dumps([url, sorted((params or {}).items())]).encode()).hexdigest()
+  return os.path.join(settings.PROVIDER_CACHE['DIR'], digest)
+
+def _load_meta(path):
+  try:
+    with open(path, 'rb') as f:
+      return json.loads(f.readline())
+  except (OSError, ValueError):
+    return None
+
+def _iter_cached(path):
+  with open(path, 'rb') as f:
+    f.readline()
+    with gzip.GzipFile(fileobj=f) as body:
+      for chunk in iter(lambda: body.read(CHUNK_SIZE), b''):
+        yield chunk
+
+def _cache_chunks(path, meta, chunks):
+  """Yield ``chunks`` while storing them, with ``meta``, at ``path``.
+
+  The file is written under a temporary name and only renamed into place
+  once every chunk went through, so readers never see a partial body.
+  """
+  os.makedirs(os.path.dirname(path), exist_ok=True)
+  fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+  try:
+    with os.fdopen(fd, 'wb') as f:
+      f.write(json.dumps(meta).encode() + b'\n')
+      with gzip.GzipFile(fileobj=f, mode='wb') as body:
+        for chunk in chunks:
+          body.write(chunk)
+          yield chunk
+    os.replace(tmp_path, path)
+  finally:
+    if os.path.exists(tmp_path):
+      os.remove(tmp_path)
+
+def iter_feed(url, params=None, auth=None, max_age=0, priority=rate_limit.SYNC):
+  """Return an iterator over the body of ``url`` in chunks, from the disk cache when possible.
+
+  Cached responses younger than ``max_age`` seconds are served without a
+  request. Older ones are revalidated with a conditional GET, and a 304
+  serves the cached body. The request is made, and requests.HTTPError
+  raised, before this returns; the body is cached as it is consumed.
+  """
+  path = _path(url, params)
+  meta = _load_meta(path)
+  if meta is not None and time.time() - meta['fetched_at'] < max_age:
+    metrics.incr('feed_cache.hits')
+    return _iter_cached(path)
+
+  headers = {}
+  if meta is not None:
+    if meta.get('etag'):
+      headers['If-None-Match'] = meta['etag']
+    if meta.get('last_modified'):
+      headers['If-Modified-Since'] = meta['last_modified']
+
+  response = client.get(url, params=params, auth=auth, headers=headers, stream=True, priority=priority)
+  if response.status_code == 304 and meta is not None:
+    metrics.incr('feed_cache.revalidated')
+    response.close()
+    meta['fetched_at'] = time.time()
+    return _cache_chunks(path, meta, _iter_cached(path))
+
+  response.raise_for_status()
+  metrics.incr('feed_cache.misses')
+  meta = {
+    'url': url,
+    'etag': response.headers.get('ETag'),
+    'last_modified': response.headers.get('Last-Modified'),
+    'fetched_at': time.time(),
+  }
+  chunks = response.iter_content(CHUNK_SIZE)
+  if max_age or meta['etag'] or meta['last_modified']:
+    return _cache_chunks(path, meta, chunks)
+  return chunks
+
+def get(url, params=None, auth=None, max_age=0, priority=rate_limit.SYNC):
+  """Return the decoded JSON body of ``url``, see iter_feed"""
+  return json.loads(b''.join(iter_feed(url, params=params, auth=auth, max_age=max_age, priority=priority)))
@@ -0,0 +1,146 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from core import metrics
+from core import utils
+from fantasy import models
+from fantasy import requests
+from fantasy import serializers
+
+# Provider syncs run outside of the request cycle. The API only queues a
+# SyncJob; manage.py sync_fantasy runs the queued jobs and queues each sync
+# again every FANTASY_SYNC['SCHEDULE'] seconds. A job only starts while no
+# other job of its kind is running (a partial unique index on status), so
+# several schedulers never run the same sync twice at once. Finished jobs are
+# deleted after FANTASY_SYNC['RETENTION_DAYS']. Live box scores are polled by
+# manage.py poll_box_scores instead, so they never wait behind a long sync.
+
+Kind = models.SyncJob.Kind
+Status = models.SyncJob.Status
+
+class SyncError(Exception):
+  """Raised when a provider feed cannot be synced"""
+
+def sync_teams():
+  response = requests.get('scores/json/teams')
+  if response['status'] != settings.RESPONSE['STATUS_OK']:
+    raise SyncError(response['response'])
+  serializer = serializers.TeamSerializer(data=utils.parse_team_list_data(response['response']), many=True)
+  if not serializer.is_valid():
+    raise SyncError(serializer.errors)
+  result = serializer.save()
+  return {key: result[key] for key in ('created', 'updated', 'unchanged')}
+
+def sync_players():
+  response = requests.get('scores/json/Players', stream=True)
+  if response['status'] != settings.RESPONSE['STATUS_OK']:
+    raise SyncError(response['response'])
+
+  # The feed is parsed as it downloads and saved chunk by chunk, so memory
+  # use does not grow with the size of the league.
+  chunk_size = settings.FANTASY_INGEST['CHUNK_SIZE']
+  counts = {'created': 0, 'updated': 0, 'unchanged': 0}
+  errors = {}
+  athlete_data = utils.iter_athlete_data(response['response'])
+  for offset, chunk in enumerate(utils.chunked(athlete_data, chunk_size)):
+    serializer = serializers.AthleteAPISerializer(data=chunk, many=True)
+    if not serializer.is_valid():
+      # Report the invalid rows and sync the others
+      errors.update({offset * chunk_size + index: error for index, error in enumerate(serializer.errors) if error})
+      chunk = [row for row, error in zip(chunk, serializer.errors) if not error]
+      serializer = serializers.AthleteAPISerializer(data=chunk, many=True)
+      if not chunk or not serializer.is_valid():
+        continue
+    result = serializer.save()
+    for key in counts:
+      counts[key] += result[key]
+  if errors and not any(counts.values()):
+    raise SyncError(errors)
+  return {**counts, 'errors': errors}
+
+SYNCS = {
+  Kind.TEAMS: sync_teams,
+  Kind.PLAYERS: sync_players,
+}
+
+def enqueue(kind):
+  """Queue a sync of ``kind``, or return the job already waiting for it"""
+  job = models.SyncJob.objects.filter(kind=kind, status=Status.QUEUED).first()
+  if job is None:
+    job = models.SyncJob.objects.create(kind=kind)
+  return job
+
+def release_stale():
+  """Fail the jobs that have been running for longer than LOCK_TIMEOUT, freeing their sync"""
+  now = timezone.now()
+  return models.SyncJob.objects.filter(
+    status=Status.RUNNING,
+    started_at__lt=now - timedelta(seconds=settings.FANTASY_SYNC['LOCK_TIMEOUT'])
+  ).update(status=Status.FAILED, finished_at=now, updated_at=now, error='Timed out.')
+
+def prune():
+  """Delete the jobs that finished more than RETENTION_DAYS ago. Returns how many."""
+  cutoff = timezone.now() - timedelta(days=settings.FANTASY_SYNC['RETENTION_DAYS'])
+  deleted, _ = models.SyncJob.objects.filter(status__in=[Status.SUCCEEDED, Status.FAILED], finished_at__lt=cutoff).delete()
+  return deleted
+
+def schedule_due(kinds):
+  """Queue the syncs of ``kinds`` whose last job was queued more than SCHEDULE seconds ago"""
+  now = timezone.now()
+  for kind in kinds:
+    every = settings.FANTASY_SYNC['SCHEDULE'].get(kind)
+    if not every:
+      continue
+    last = models.SyncJob.objects.filter(kind=kind).order_by('-created_at').first()
+    if last is None or (last.status in (Status.SUCCEEDED, Status.FAILED) and last.created_at <= now - timedelta(seconds=every)):
+      enqueue(kind)
+
+def _claim(job):
+  now = timezone.now()
+  try:
+    with transaction.atomic():
+      claimed = models.SyncJob.objects.filter(pk=job.pk, status=Status.QUEUED).update(
+        status=Status.RUNNING, started_at=now, updated_at=now
+      )
+  except IntegrityError:
+    # Another job of this kind is running
+    return False
+  if claimed:
+    job.status = Status.RUNNING
+    job.started_at = now
+  return bool(claimed)
+
+def run_job(job):
+  """Run a queued job. False if another worker claimed it or its sync is already running."""
+  if not _claim(job):
+    return False
+
+  start = time.monotonic()
+  try:
+    job.result = SYNCS[job.kind]()
+    job.status = Status.SUCCEEDED
+  except Exception as e:
+    job.error = str(e)
+    job.status = Status.FAILED
+    metrics.incr('fantasy_sync.' + job.kind + '.failed')
+  job.finished_at = timezone.now()
+  job.save(update_fields=['status', 'result', 'error', 'finished_at', 'updated_at'])
+  metrics.incr('fantasy_sync.' + job.kind + '.runs')
+  metrics.observe('fantasy_sync.' + job.kind + '.seconds', time.monotonic() - start)
+  return True
+
+def run_once(kinds=None):
+  """Queue the due syncs and run the queued jobs of ``kinds`` (default: all). Returns the jobs that ran."""
+  kinds = kinds or list(SYNCS)
+  release_stale()
+  prune()
+  schedule_due(kinds)
+  metrics.gauge('fantasy_sync.queue_depth', models.SyncJob.objects.filter(status=Status.QUEUED).count())
+  return [
+    job for job in models.SyncJob.objects.filter(kind__in=kinds, status=Status.QUEUED).order_by('created_at')
+    if run_job(job)
+  ]
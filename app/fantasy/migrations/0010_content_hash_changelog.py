@@ -0,0 +1,39 @@
+# Generated by Django 3.2.7 on 2026-10-18 16:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fantasy', '0009_alter_athlete_position'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True, null=True)),
+                ('model', models.CharField(max_length=30)),
+                ('object_id', models.IntegerField()),
+                ('api_id', models.IntegerField()),
+                ('action', models.CharField(choices=[('CREATED', 'Created'), ('UPDATED', 'Updated')], max_length=30)),
+                ('changes', models.JSONField()),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='athlete',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', max_length=40),
+        ),
+        migrations.AddField(
+            model_name='team',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', max_length=40),
+        ),
+    ]
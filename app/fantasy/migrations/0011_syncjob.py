@@ -0,0 +1,34 @@
+# Generated by Django 3.2.7 on 2026-10-18 16:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fantasy', '0010_content_hash_changelog'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True, null=True)),
+                ('kind', models.CharField(choices=[('teams', 'Teams'), ('players', 'Players')], max_length=30)),
+                ('status', models.CharField(choices=[('QUEUED', 'Queued'), ('RUNNING', 'Running'), ('SUCCEEDED', 'Succeeded'), ('FAILED', 'Failed')], default='QUEUED', max_length=30)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('result', models.JSONField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+            ],
+            options={
+                'ordering': ['-created_at', '-updated_at'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='syncjob',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'RUNNING')), fields=('kind',), name='one_running_sync_per_kind'),
+        ),
+    ]
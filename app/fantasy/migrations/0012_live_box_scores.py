@@ -0,0 +1,67 @@
+# Generated by Django 3.2.7 on 2026-10-18 16:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fantasy', '0011_syncjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gameschedule',
+            name='api_id',
+            field=models.IntegerField(blank=True, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='gameschedule',
+            name='next_poll_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='gameschedule',
+            name='status',
+            field=models.CharField(default='Scheduled', max_length=30),
+        ),
+        migrations.AlterField(
+            model_name='gameathlete',
+            name='athlete',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='fantasy.athlete'),
+        ),
+        migrations.AlterField(
+            model_name='gameathlete',
+            name='game',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='fantasy.game'),
+        ),
+        migrations.AlterField(
+            model_name='gameathletestat',
+            name='game_schedule',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='fantasy.gameschedule'),
+        ),
+        migrations.AlterField(
+            model_name='gameschedule',
+            name='team1',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='GameSchedule_team1', to='fantasy.team'),
+        ),
+        migrations.AlterField(
+            model_name='gameschedule',
+            name='team2',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='GameSchedule_team2', to='fantasy.team'),
+        ),
+        migrations.AlterField(
+            model_name='syncjob',
+            name='kind',
+            field=models.CharField(choices=[('teams', 'Teams'), ('players', 'Players'), ('stats', 'Stats')], max_length=30),
+        ),
+        migrations.AddIndex(
+            model_name='gameschedule',
+            index=models.Index(fields=['status', 'next_poll_at'], name='game_schedule_poll_due'),
+        ),
+        migrations.AddConstraint(
+            model_name='gameathlete',
+            constraint=models.UniqueConstraint(fields=('game', 'athlete'), name='unique_game_athlete'),
+        ),
+    ]
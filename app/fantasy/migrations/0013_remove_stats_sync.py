@@ -0,0 +1,23 @@
+# Generated by Django 3.2.7 on 2026-10-18 16:23
+
+from django.db import migrations, models
+
+
+def delete_stats_jobs(apps, schema_editor):
+    # Live box scores are polled by manage.py poll_box_scores, not SyncJobs
+    apps.get_model('fantasy', 'SyncJob').objects.filter(kind='stats').delete()
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fantasy', '0012_live_box_scores'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_stats_jobs, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='syncjob',
+            name='kind',
+            field=models.CharField(choices=[('teams', 'Teams'), ('players', 'Players')], max_length=30),
+        ),
+    ]
@@ -12,6 +12,7 @@ class Athlete(BaseInfo):
     salary = models.IntegerField(null=True, blank=True)
     is_active = models.BooleanField(default=True, blank=True)
     is_injured = models.BooleanField(default=False, blank=True)
+    content_hash = models.CharField(max_length=40, blank=True, default='') #Hash of the synced provider fields
 
     def __str__(self):
         return self.first_name + ' ' + self.last_name
@@ -36,6 +37,7 @@ class Team(BaseInfo):
     location = models.CharField(max_length=155)
     name = models.CharField(max_length=155)
     api_id = models.IntegerField(unique=True)
+    content_hash = models.CharField(max_length=40, blank=True, default='') #Hash of the synced provider fields
 
     def __str__(self):
         return self.location + ' ' + self.name
@@ -58,14 +60,20 @@ class Game(BaseInfo):
 class GameSchedule(BaseInfo):
     game = models.OneToOneField("Game", on_delete=models.CASCADE)
     datetime = models.DateTimeField()
-    team1 = models.OneToOneField("Team", on_delete=models.CASCADE, related_name="GameSchedule_team1")
-    team2 = models.OneToOneField("Team", on_delete=models.CASCADE, related_name="GameSchedule_team2")
+    team1 = models.ForeignKey("Team", on_delete=models.CASCADE, related_name="GameSchedule_team1")
+    team2 = models.ForeignKey("Team", on_delete=models.CASCADE, related_name="GameSchedule_team2")
+    api_id = models.IntegerField(unique=True, null=True, blank=True) #game id from sportsdata
+    status = models.CharField(max_length=30, default='Scheduled') #game status reported by sportsdata
+    next_poll_at = models.DateTimeField(null=True, blank=True) #next box score poll, set from the game status
 
     def __str__(self):
         return self.game.name + ' ' + self.datetime
     
     class Meta:
         ordering = ['-created_at', '-updated_at']
+        indexes = [
+            models.Index(fields=['status', 'next_poll_at'], name='game_schedule_poll_due'),
+        ]
 
 
 class GameTeam(BaseInfo):
@@ -80,11 +88,14 @@ class GameTeam(BaseInfo):
         ordering = ['-created_at', '-updated_at']
 
 class GameAthlete(BaseInfo):
-    game = models.OneToOneField("Game", on_delete=models.CASCADE)
-    athlete = models.OneToOneField("Athlete", on_delete=models.CASCADE)
+    game = models.ForeignKey("Game", on_delete=models.CASCADE)
+    athlete = models.ForeignKey("Athlete", on_delete=models.CASCADE)
     
     class Meta:
         ordering = ['-created_at', '-updated_at']
+        constraints = [
+            models.UniqueConstraint(fields=['game', 'athlete'], name='unique_game_athlete'),
+        ]
 
 class GameAsset(BaseInfo):
     game_team = models.OneToOneField("GameTeam", on_delete=models.CASCADE)
@@ -96,9 +107,53 @@ class GameAsset(BaseInfo):
 
 class GameAthleteStat(BaseInfo):
     game_athlete = models.OneToOneField("GameAthlete", on_delete=models.CASCADE)
-    game_schedule = models.OneToOneField("GameSchedule", on_delete=models.CASCADE)
+    game_schedule = models.ForeignKey("GameSchedule", on_delete=models.CASCADE)
     fantasy_score = models.DecimalField(max_digits=19, decimal_places=2)
     
     class Meta:
         ordering = ['-created_at', '-updated_at']
 
+
+class ChangeLog(BaseInfo):
+    """A provider record that was created or changed by a sync"""
+    class Action(models.TextChoices):
+        CREATED = 'CREATED'
+        UPDATED = 'UPDATED'
+    model = models.CharField(max_length=30) #athlete or team
+    object_id = models.IntegerField()
+    api_id = models.IntegerField()
+    action = models.CharField(max_length=30, choices=Action.choices)
+    changes = models.JSONField() #New values of the changed fields
+
+    def __str__(self):
+        return self.model + ' ' + str(self.api_id) + ' ' + self.action
+
+    class Meta:
+        ordering = ['id']
+
+class SyncJob(BaseInfo):
+    """A provider sync requested through the API or scheduled by manage.py sync_fantasy"""
+    class Kind(models.TextChoices):
+        TEAMS = 'teams'
+        PLAYERS = 'players'
+    class Status(models.TextChoices):
+        QUEUED = 'QUEUED'
+        RUNNING = 'RUNNING'
+        SUCCEEDED = 'SUCCEEDED'
+        FAILED = 'FAILED'
+    kind = models.CharField(max_length=30, choices=Kind.choices)
+    status = models.CharField(max_length=30, choices=Status.choices, default=Status.QUEUED)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True) #Counts reported by the sync
+    error = models.TextField(blank=True)
+
+    def __str__(self):
+        return self.kind + ' ' + self.status
+
+    class Meta:
+        ordering = ['-created_at', '-updated_at']
+        constraints = [
+            # Doubles as the lock against overlapping runs of the same sync
+            models.UniqueConstraint(fields=['kind'], condition=models.Q(status='RUNNING'), name='one_running_sync_per_kind'),
+        ]
@@ -0,0 +1,120 @@
+import asyncio
+import fcntl
+import json
+import os
+import time
+
+from django.conf import settings
+
+from core import metrics
+
+# Token buckets shared by every process on the host. Each provider host in
+# PROVIDER_RATE_LIMIT['BUCKETS'] has a small JSON file holding its tokens,
+# updated under an exclusive flock, so gunicorn workers and management
+# commands draw from the same per-key budget. A priority class only takes a
+# token while more than its RESERVE share of the burst is left, which keeps
+# headroom for the classes above it (live scoring ahead of roster syncs).
+
+LIVE = 'live'
+SYNC = 'sync'
+
+class RateLimitExceeded(Exception):
+  """Raised when no token frees up within the priority's MAX_WAIT"""
+
+def _path(host):
+  return os.path.join(settings.PROVIDER_RATE_LIMIT['DIR'], host + '.bucket')
+
+def _update(host, take):
+  """Refill the bucket of ``host`` and apply ``take(tokens) -> (tokens, result)`` under the file lock"""
+  bucket = settings.PROVIDER_RATE_LIMIT['BUCKETS'][host]
+  os.makedirs(settings.PROVIDER_RATE_LIMIT['DIR'], exist_ok=True)
+  with os.fdopen(os.open(_path(host), os.O_RDWR | os.O_CREAT, 0o600), 'r+') as f:
+    fcntl.flock(f, fcntl.LOCK_EX)
+    now = time.time()
+    try:
+      state = json.loads(f.read())
+      tokens = min(bucket['BURST'], state['tokens'] + max(now - state['updated'], 0) * bucket['RATE'])
+    except (ValueError, KeyError):
+      tokens = bucket['BURST']
+    tokens, result = take(tokens)
+    f.seek(0)
+    f.truncate()
+    f.write(json.dumps({'tokens': tokens, 'updated': now}))
+  metrics.gauge('provider.' + host + '.tokens', tokens)
+  return result
+
+def try_acquire(host, priority=SYNC):
+  """Take a token for one request to ``host`` without waiting.
+
+  Returns 0 once the token is taken, otherwise the seconds until one frees up
+  for ``priority``. Hosts without a bucket are not limited.
+  """
+  config = settings.PROVIDER_RATE_LIMIT
+  if host not in config['BUCKETS']:
+    return 0
+  bucket = config['BUCKETS'][host]
+  floor = config['PRIORITIES'][priority]['RESERVE'] * bucket['BURST']
+
+  def take(tokens):
+    if tokens - 1 >= floor:
+      return tokens - 1, 0
+    return tokens, (floor + 1 - tokens) / bucket['RATE']
+
+  return _update(host, take)
+
+def _wait_for(host, priority, wait, deadline):
+  """Count a wait of ``wait`` seconds for a token, or raise RateLimitExceeded if it ends past ``deadline``"""
+  if time.monotonic() + wait > deadline:
+    metrics.incr('provider.' + host + '.rate_limited')
+    raise RateLimitExceeded(f'Rate limit of {host} reached for {priority} requests')
+  metrics.incr('provider.' + host + '.rate_limit_waits')
+
+def _max_wait(priority, max_wait):
+  return settings.PROVIDER_RATE_LIMIT['PRIORITIES'][priority]['MAX_WAIT'] if max_wait is None else max_wait
+
+def acquire(host, priority=SYNC, max_wait=None):
+  """Take a token for one request to ``host``, waiting for it up to ``max_wait`` seconds.
+
+  ``max_wait`` defaults to the MAX_WAIT of ``priority``; 0 fails right away.
+  Raises RateLimitExceeded when the wait would be longer. Hosts without a
+  bucket are not limited.
+  """
+  deadline = time.monotonic() + _max_wait(priority, max_wait)
+  while True:
+    wait = try_acquire(host, priority)
+    if not wait:
+      return
+    _wait_for(host, priority, wait, deadline)
+    time.sleep(wait)
+
+async def aacquire(host, priority=SYNC, max_wait=None):
+  """Coroutine version of acquire().
+
+  It waits with asyncio.sleep instead of blocking a thread, so a request
+  cancelled while waiting (e.g. at its deadline) never takes a token.
+  """
+  deadline = time.monotonic() + _max_wait(priority, max_wait)
+  while True:
+    wait = try_acquire(host, priority)
+    if not wait:
+      return
+    _wait_for(host, priority, wait, deadline)
+    await asyncio.sleep(wait)
+
+def drain(host):
+  """Empty the bucket of ``host``, e.g. after the provider answered 429"""
+  if host in settings.PROVIDER_RATE_LIMIT['BUCKETS']:
+    _update(host, lambda tokens: (0, None))
+
+def remaining(host):
+  """Tokens left in the bucket of ``host``, None if it is not limited"""
+  if host not in settings.PROVIDER_RATE_LIMIT['BUCKETS']:
+    return None
+  return _update(host, lambda tokens: (tokens, tokens))
+
+def budget():
+  """Tokens left and bucket settings of every limited host"""
+  return {
+    host: {'remaining': remaining(host), 'rate': bucket['RATE'], 'burst': bucket['BURST']}
+    for host, bucket in settings.PROVIDER_RATE_LIMIT['BUCKETS'].items()
+  }
@@ -1,3 +1,4 @@
+import asyncio
 import datetime
 import hashlib
 import os
@@ -9,31 +10,39 @@ import requests
 from requests.exceptions import HTTPError
 from django.conf import settings
 
+from core import utils
+from fantasy import aclient
+from fantasy import feed_cache
+from fantasy import rate_limit
+
 HOST = 'https://api.sportsdata.io/v3/mlb/'
 KEY = os.environ.get('SPORTDATAIO_KEY', '')
 
-def get(url, args=[], stream=False):
+def get(url, args=[], stream=False, priority=rate_limit.SYNC):
   try:
     if args:
       params = dict(f.split('=') for f in args)
     else:
       params = {}
 
-    params.update(get_auth())
-
+    max_age = feed_cache.get_max_age(url)
     url = HOST + url
-    response = requests.get(
-      url,
-      params=params,
-      stream=stream
-    )
-    response.raise_for_status()
+    if stream:
+      # Items of the top-level JSON array, parsed as the body arrives
+      data = utils.iter_json_array(feed_cache.iter_feed(url, params=params, auth=get_auth, max_age=max_age, priority=priority))
+    else:
+      data = feed_cache.get(url, params=params, auth=get_auth, max_age=max_age, priority=priority)
 
     return {
       'status': settings.RESPONSE['STATUS_OK'],
-      'response': response.json()
+      'response': data
     }
 
+  except rate_limit.RateLimitExceeded as e:
+    return {
+      'status': settings.RESPONSE['STATUS_ERROR'],
+      'response': f'{e} when downloading: {url}'
+    }
   except requests.Timeout:
     return {
       'status': settings.RESPONSE['STATUS_ERROR'],
@@ -50,6 +59,26 @@ def get(url, args=[], stream=False):
       'response': f'HTTP error occurred: {http_err}'
     }
 
+async def aget_many(urls, args=[], priority=rate_limit.SYNC, concurrency=None):
+  """Fetch several endpoints concurrently. Returns one get() style result per url, in order."""
+  params = dict(f.split('=') for f in args) if args else {}
+  urls = [HOST + url for url in urls]
+  responses = await aclient.aget_many(urls, params=params, auth=get_auth, priority=priority, concurrency=concurrency, return_exceptions=True)
+  return [
+    {
+      'status': settings.RESPONSE['STATUS_ERROR'],
+      'response': aclient.describe_error(url, response)
+    } if isinstance(response, Exception) else {
+      'status': settings.RESPONSE['STATUS_OK'],
+      'response': response
+    }
+    for url, response in zip(urls, responses)
+  ]
+
+def get_many(urls, args=[], priority=rate_limit.SYNC, concurrency=None):
+  """Blocking aget_many. It runs its own event loop, so coroutines await aget_many instead."""
+  return asyncio.run(aget_many(urls, args, priority, concurrency))
+
 def get_auth():
   params = {
     'key': KEY
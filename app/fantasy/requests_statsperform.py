@@ -1,3 +1,4 @@
+import asyncio
 import datetime
 import hashlib
 import os
@@ -9,24 +10,28 @@ import requests
 from requests.exceptions import HTTPError
 from django.conf import settings
 
+from fantasy import aclient
+from fantasy import client
+from fantasy import rate_limit
+
 HOST = 'http://api.stats.com/v1/stats/basketball/nba/'
 PUBLIC_KEY = os.environ.get('STATSPERFORM_PUBLIC_KEY', '')
 SECRET_KEY = os.environ.get('STATSPERFORM_PRIVATE_KEY', '')
 
-def get(url, args=[], stream=False):
+def get(url, args=[], stream=False, priority=rate_limit.SYNC):
   try:
     if args:
       params = dict(f.split('=') for f in args)
     else:
       params = {}
 
-    params.update(get_sig())
-
     url = HOST + url
-    response = requests.get(
+    response = client.get(
       url,
       params=params,
-      stream=stream
+      auth=get_sig,
+      stream=stream,
+      priority=priority
     )
     response.raise_for_status()
 
@@ -35,6 +40,11 @@ def get(url, args=[], stream=False):
       'response': response.json().get('apiResults')[0]
     }
 
+  except rate_limit.RateLimitExceeded as e:
+    return {
+      'status': settings.RESPONSE['STATUS_ERROR'],
+      'response': f'{e} when downloading: {url}'
+    }
   except requests.Timeout:
     return {
       'status': settings.RESPONSE['STATUS_ERROR'],
@@ -51,6 +61,26 @@ def get(url, args=[], stream=False):
       'response': f'HTTP error occurred: {http_err}'
     }
 
+async def aget_many(urls, args=[], priority=rate_limit.SYNC, concurrency=None):
+  """Fetch several endpoints concurrently. Returns one get() style result per url, in order."""
+  params = dict(f.split('=') for f in args) if args else {}
+  urls = [HOST + url for url in urls]
+  responses = await aclient.aget_many(urls, params=params, auth=get_sig, priority=priority, concurrency=concurrency, return_exceptions=True)
+  return [
+    {
+      'status': settings.RESPONSE['STATUS_ERROR'],
+      'response': aclient.describe_error(url, response)
+    } if isinstance(response, Exception) else {
+      'status': settings.RESPONSE['STATUS_OK'],
+      'response': response.get('apiResults')[0]
+    }
+    for url, response in zip(urls, responses)
+  ]
+
+def get_many(urls, args=[], priority=rate_limit.SYNC, concurrency=None):
+  """Blocking aget_many. It runs its own event loop, so coroutines await aget_many instead."""
+  return asyncio.run(aget_many(urls, args, priority, concurrency))
+
 def get_sig():
   timestamp = repr(int(time.time()))
   all = str.encode(PUBLIC_KEY + SECRET_KEY + timestamp)
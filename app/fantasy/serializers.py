@@ -1,27 +1,30 @@
 from rest_framework import serializers, status, validators
 
 from fantasy import models
+from fantasy import sync
 from core import utils
 
 # Fantasy data serializers
+TEAM_SYNC_FIELDS = ['location', 'name']
+
 class TeamListSerializer(serializers.ListSerializer):
   def save(self):
+    """Upsert the teams keyed on api_id with a constant number of queries"""
+    teams, created, updated, unchanged = sync.upsert(models.Team, self.validated_data, TEAM_SYNC_FIELDS)
+    counts = {'created': len(created), 'updated': len(updated), 'unchanged': len(unchanged)}
+    created = {team.api_id for team in created}
     teams_list = []
     for team_data in self.validated_data:
-      team, is_created = models.Team.objects.get_or_create(
-        api_id = team_data['api_id'],
-        defaults = {
-          'location': team_data['location'],
-          'name': team_data['name'],
-        }
-      )
       teams_list.append({
-        "is_created": is_created,
-        "data": team
+        # A team repeated in the request is only created once
+        "is_created": team_data['api_id'] in created,
+        "data": teams[team_data['api_id']]
       })
+      created.discard(team_data['api_id'])
     return {
       'message': "Teams added.",
-      'data': teams_list
+      'data': teams_list,
+      **counts
     }
 
 
@@ -39,8 +42,33 @@ class TeamSerializer(serializers.ModelSerializer):
     read_only_fields = ['id']
     list_serializer_class = TeamListSerializer
 
+ATHLETE_SYNC_FIELDS = ['first_name', 'last_name', 'position', 'salary', 'jersey', 'is_active', 'is_injured', 'team_id']
+
+def upsert_athletes(rows):
+  """Insert or update athletes keyed on api_id. Returns (created, updated, unchanged) lists of Athlete objects."""
+  athletes, created, updated, unchanged = sync.upsert(models.Athlete, rows, ATHLETE_SYNC_FIELDS)
+  return created, updated, unchanged
+
+class AthleteAPIListSerializer(serializers.ListSerializer):
+  def to_internal_value(self, data):
+    # Resolve the teams of every row with a single query
+    if isinstance(data, list):
+      team_ids = {row.get('team_id') for row in data if isinstance(row, dict)}
+      self.context['teams'] = {team.api_id: team for team in models.Team.objects.filter(api_id__in=team_ids)}
+    return super().to_internal_value(data)
+
+  def save(self):
+    created, updated, unchanged = upsert_athletes(self.validated_data)
+    return {
+      'message': "Athletes synced.",
+      'created': len(created),
+      'updated': len(updated),
+      'unchanged': len(unchanged)
+    }
+
 #Serializer for Stats Perform API data
 class AthleteAPISerializer(serializers.ModelSerializer):
+    api_id = serializers.IntegerField() # Upserted on api_id, no uniqueness check
     team_id = serializers.IntegerField()
     is_active = serializers.CharField(allow_null=True)
     is_injured = serializers.CharField(allow_null=True)
@@ -65,6 +93,7 @@ class AthleteAPISerializer(serializers.ModelSerializer):
             'is_active': { 'write_only': True },
             'is_injured': { 'write_only': True }
         }
+        list_serializer_class = AthleteAPIListSerializer
 
     def validate(self, data):
         if data['is_active'] == 'Active':
@@ -77,34 +106,26 @@ class AthleteAPISerializer(serializers.ModelSerializer):
         else:
             data['is_injured'] = True
 
-        data['team'] = models.Team.objects.get(api_id=data['team_id'])
-        data['team_id'] = data['team'].id
+        teams = self.context.get('teams')
+        if teams is not None:
+            team = teams.get(data['team_id'])
+        else:
+            team = models.Team.objects.filter(api_id=data['team_id']).first()
+        if team is None:
+            raise serializers.ValidationError({'team_id': 'No team with this api_id.'})
+        data['team'] = team
+        data['team_id'] = team.id
         return data
     
     def save(self):
         if self.instance is not None:
-            self.instance.first_name = self.validated_data.get('first_name')
-            self.instance.last_name = self.validated_data.get('last_name')
-            self.instance.api_id = self.validated_data.get('api_id')
-            self.instance.position = self.validated_data.get('position')
-            self.instance.salary = self.validated_data.get('salary')
-            self.instance.jersey = self.validated_data.get('jersey')
-            self.instance.is_active = self.validated_data.get('is_active')
-            self.instance.is_injured = self.validated_data.get('is_injured')
-            self.instance.team = self.validated_data.get('team')
+            for field in ATHLETE_SYNC_FIELDS + ['api_id']:
+                setattr(self.instance, field, self.validated_data.get(field))
+            self.instance.save()
+            athlete = self.instance
         else:
-            athlete = models.Athlete(
-                first_name = self.validated_data['first_name'],
-                last_name = self.validated_data['last_name'],
-                api_id = self.validated_data['api_id'],
-                position = self.validated_data['position'],
-                salary = self.validated_data['salary'],
-                jersey = self.validated_data['jersey'],
-                is_active = self.validated_data['is_active'],
-                is_injured = self.validated_data['is_injured'],
-                team = self.validated_data.get('team'),
-            )
-            athlete.save()
+            created, updated, unchanged = upsert_athletes([self.validated_data])
+            athlete = (created + updated + unchanged)[0]
 
         return {
             'message': "Athlete added.",
@@ -127,6 +148,33 @@ class AthleteSerializer(serializers.ModelSerializer):
             'is_injured',
         ]
 
+class ChangeLogSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = models.ChangeLog
+        fields = [
+            'id',
+            'model',
+            'object_id',
+            'api_id',
+            'action',
+            'changes',
+            'created_at',
+        ]
+
+class SyncJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = models.SyncJob
+        fields = [
+            'id',
+            'kind',
+            'status',
+            'started_at',
+            'finished_at',
+            'result',
+            'error',
+            'created_at',
+        ]
+
 class GameSerializer(serializers.ModelSerializer):
     class Meta:
         model = models.Game
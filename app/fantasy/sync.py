@@ -0,0 +1,83 @@
+import hashlib
+import json
+
+from django.db import transaction
+from django.utils import timezone
+
+from fantasy import models
+
+# Set-based upserts of provider records keyed on api_id. Every record keeps a
+# hash of its synced fields, so unchanged records are skipped without a write,
+# and each insert or change is appended to ChangeLog for consumers that only
+# want the delta since their last sync.
+
+def content_hash(row, fields):
+  return hashlib.sha1(json.dumps([row[field] for field in fields], default=str).encode()).hexdigest()
+
+def upsert(model, rows, fields):
+  """Insert or update ``rows`` (dicts with api_id and ``fields``) of ``model``.
+
+  Returns (objects, created, updated, unchanged): objects maps each api_id
+  to its instance, the others are lists of instances. Runs one bulk insert,
+  one bulk update and one change log insert in a single transaction.
+  """
+  rows = {row['api_id']: row for row in rows}
+  with transaction.atomic():
+    objects = {obj.api_id: obj for obj in model.objects.select_for_update().filter(api_id__in=rows)}
+    created = []
+    updated = []
+    unchanged = []
+    rehashed = []
+    now = timezone.now()
+    for api_id, row in rows.items():
+      digest = content_hash(row, fields)
+      obj = objects.get(api_id)
+      if obj is None:
+        obj = model(api_id=api_id, content_hash=digest, **{field: row[field] for field in fields})
+        objects[api_id] = obj
+        created.append(obj)
+        continue
+      if obj.content_hash == digest:
+        unchanged.append(obj)
+        continue
+
+      changes = {field: row[field] for field in fields if getattr(obj, field) != row[field]}
+      obj.content_hash = digest
+      if not changes:
+        # Synced before content hashes were stored
+        rehashed.append(obj)
+        unchanged.append(obj)
+        continue
+      for field, value in changes.items():
+        setattr(obj, field, value)
+      obj.updated_at = now
+      updated.append((obj, changes))
+
+    model.objects.bulk_create(created)
+    if created and created[0].pk is None:
+      # Backends that do not return ids from bulk inserts
+      pks = dict(model.objects.filter(api_id__in=[obj.api_id for obj in created]).values_list('api_id', 'pk'))
+      for obj in created:
+        obj.pk = pks[obj.api_id]
+    model.objects.bulk_update([obj for obj, changes in updated], fields + ['content_hash', 'updated_at'])
+    model.objects.bulk_update(rehashed, ['content_hash'])
+
+    name = model._meta.model_name
+    models.ChangeLog.objects.bulk_create([
+      models.ChangeLog(
+        model=name,
+        object_id=obj.pk,
+        api_id=obj.api_id,
+        action=models.ChangeLog.Action.CREATED,
+        changes={field: getattr(obj, field) for field in fields}
+      ) for obj in created
+    ] + [
+      models.ChangeLog(
+        model=name,
+        object_id=obj.pk,
+        api_id=obj.api_id,
+        action=models.ChangeLog.Action.UPDATED,
+        changes=changes
+      ) for obj, changes in updated
+    ])
+  return objects, created, [obj for obj, changes in updated], unchanged
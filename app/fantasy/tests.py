@@ -0,0 +1,278 @@
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from django.conf import settings
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from core import utils
+from fantasy import aclient
+from fantasy import box_scores
+from fantasy import ingest
+from fantasy import models
+from fantasy import rate_limit
+from fantasy import requests
+
+
+class FakeProvider:
+    """A local HTTP server answering GETs from a {path: (status, headers, body)} dict"""
+
+    def __init__(self, routes):
+        self.routes = routes
+        self.requests = []
+        provider = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split('?')[0]
+                provider.requests.append((path, dict(self.headers)))
+                status, headers, body = provider.routes.get(path, (404, {}, b'{}'))
+                if callable(body):
+                    status, headers, body = body(self.headers)
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:%d/' % self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FeedCacheTests(SimpleTestCase):
+    PLAYERS = [{'PlayerID': i, 'FirstName': 'F', 'LastName': str(i), 'Status': 'Active'} for i in range(2000)]
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir, ignore_errors=True)
+        cache = override_settings(PROVIDER_CACHE=dict(settings.PROVIDER_CACHE, DIR=self.cache_dir, MAX_AGE={}, DEFAULT_MAX_AGE=0))
+        cache.enable()
+        self.addCleanup(cache.disable)
+
+    def players(self, headers):
+        if headers.get('If-None-Match') == '"v1"':
+            return 304, {}, b''
+        return 200, {'Content-Type': 'application/json', 'ETag': '"v1"'}, json.dumps(self.PLAYERS).encode()
+
+    def test_streamed_fetch_is_cached_and_revalidated(self):
+        with FakeProvider({'/scores/json/Players': (200, {}, self.players)}) as provider:
+            with mock.patch.object(requests, 'HOST', provider.url):
+                for _ in range(3):
+                    response = requests.get('scores/json/Players', stream=True)
+                    self.assertEqual(response['status'], settings.RESPONSE['STATUS_OK'])
+                    self.assertEqual(len(list(utils.iter_athlete_data(response['response']))), len(self.PLAYERS))
+                    self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+        self.assertEqual(len(provider.requests), 3)
+        self.assertNotIn('If-None-Match', provider.requests[0][1])
+        self.assertEqual([headers.get('If-None-Match') for path, headers in provider.requests[1:]], ['"v1"', '"v1"'])
+
+
+def take_tokens(host, seconds, results):
+    """Take LIVE tokens from the bucket of ``host`` for ``seconds``, then report how many"""
+    taken = 0
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        rate_limit.acquire(host, rate_limit.LIVE)
+        taken += 1
+    results.put(taken)
+
+
+class RateLimitTests(SimpleTestCase):
+    HOST = 'api.example.com'
+
+    def setUp(self):
+        self.rate_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.rate_dir, ignore_errors=True)
+        self.limit(rate=20)
+
+    def limit(self, rate):
+        limit = override_settings(PROVIDER_RATE_LIMIT={
+            'DIR': self.rate_dir,
+            'BUCKETS': {self.HOST: {'RATE': rate, 'BURST': 10}},
+            'PRIORITIES': {
+                rate_limit.LIVE: {'RESERVE': 0, 'MAX_WAIT': 5},
+                rate_limit.SYNC: {'RESERVE': 0.5, 'MAX_WAIT': 5},
+            },
+        })
+        limit.enable()
+        self.addCleanup(limit.disable)
+
+    def test_processes_share_one_bucket(self):
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        workers = [context.Process(target=take_tokens, args=(self.HOST, 1, results)) for _ in range(4)]
+        start = time.monotonic()
+        for worker in workers:
+            worker.start()
+        taken = sum(results.get(timeout=10) for _ in workers)
+        elapsed = time.monotonic() - start
+        for worker in workers:
+            worker.join()
+
+        # The burst plus the refill, not four times that
+        self.assertLessEqual(taken, 10 + 20 * elapsed + 1)
+        self.assertGreaterEqual(taken, 10 + 20 * 0.8)
+
+    def test_lower_priorities_leave_their_reserve(self):
+        self.limit(rate=0.001)
+        synced = 0
+        with self.assertRaises(rate_limit.RateLimitExceeded):
+            while True:
+                rate_limit.acquire(self.HOST, rate_limit.SYNC, max_wait=0)
+                synced += 1
+        self.assertEqual(synced, 5)
+
+        for _ in range(5):
+            rate_limit.acquire(self.HOST, rate_limit.LIVE, max_wait=0)
+        with self.assertRaises(rate_limit.RateLimitExceeded):
+            rate_limit.acquire(self.HOST, rate_limit.LIVE, max_wait=0)
+
+    def test_hosts_without_a_bucket_are_not_limited(self):
+        for _ in range(100):
+            rate_limit.acquire('api.other.com', rate_limit.SYNC, max_wait=0)
+        self.assertIsNone(rate_limit.remaining('api.other.com'))
+
+
+class AsyncRateLimitTests(SimpleTestCase):
+
+    def setUp(self):
+        self.provider = FakeProvider({'/feed': (200, {'Content-Type': 'application/json'}, b'{}')})
+        self.provider.__enter__()
+        self.addCleanup(self.provider.__exit__)
+        self.host = self.provider.url.split('/')[2]
+        self.rate_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.rate_dir, ignore_errors=True)
+        limit = override_settings(PROVIDER_RATE_LIMIT=dict(
+            settings.PROVIDER_RATE_LIMIT,
+            DIR=self.rate_dir,
+            BUCKETS={self.host: {'RATE': 2, 'BURST': 1}},
+            PRIORITIES={rate_limit.SYNC: {'RESERVE': 0, 'MAX_WAIT': 60}},
+        ))
+        limit.enable()
+        self.addCleanup(limit.disable)
+
+    def test_token_waits_end_with_the_request_deadline(self):
+        start = time.monotonic()
+        results = aclient.get_many([self.provider.url + 'feed'] * 3, deadline=0.3, concurrency=3, return_exceptions=True)
+
+        self.assertLess(time.monotonic() - start, 0.3)
+        self.assertEqual(results[0], {})
+        self.assertIsInstance(results[1], rate_limit.RateLimitExceeded)
+        self.assertIsInstance(results[2], rate_limit.RateLimitExceeded)
+        # Nothing keeps waiting for a token after the batch returned
+        time.sleep(0.6)
+        self.assertEqual(rate_limit.remaining(self.host), 1)
+        self.assertEqual(len(self.provider.requests), 1)
+
+
+class AsyncClientTests(SimpleTestCase):
+
+    def setUp(self):
+        http = override_settings(PROVIDER_HTTP=dict(settings.PROVIDER_HTTP, MAX_RETRIES=2, BACKOFF_BASE=0.01))
+        http.enable()
+        self.addCleanup(http.disable)
+
+    def test_failed_requests_do_not_fail_the_batch(self):
+        json_headers = {'Content-Type': 'application/json'}
+        with FakeProvider({
+            '/ok': (200, json_headers, b'{"a": 1}'),
+            '/missing': (404, json_headers, b'{}'),
+            '/down': (503, json_headers, b'{}'),
+        }) as provider:
+            with mock.patch.object(requests, 'HOST', provider.url):
+                responses = requests.get_many(['down', 'ok', 'missing'])
+
+        self.assertEqual([response['status'] for response in responses], [
+            settings.RESPONSE['STATUS_ERROR'], settings.RESPONSE['STATUS_OK'], settings.RESPONSE['STATUS_ERROR'],
+        ])
+        self.assertEqual(responses[1]['response'], {'a': 1})
+        self.assertIn('503', responses[0]['response'])
+        self.assertIn('404', responses[2]['response'])
+        # 5xx is retried MAX_RETRIES times, 404 is not
+        paths = [path for path, headers in provider.requests]
+        self.assertEqual((paths.count('/down'), paths.count('/missing')), (3, 1))
+
+
+class SaveBoxScoresTests(TestCase):
+
+    def setUp(self):
+        now = timezone.now()
+        home = models.Team.objects.create(location='Home', name='Home', api_id=1)
+        away = models.Team.objects.create(location='Away', name='Away', api_id=2)
+        self.athletes = [models.Athlete.objects.create(first_name='F', last_name=str(i), api_id=i, team=home) for i in range(3)]
+        self.schedules = []
+        for api_id in (10, 20):
+            game = models.Game.objects.create(name=str(api_id), start_datetime=now, duration=1, prize=0)
+            self.schedules.append(models.GameSchedule.objects.create(game=game, datetime=now, team1=home, team2=away, api_id=api_id))
+        # Athlete 0 plays in both fantasy games, but only in the box score of the first
+        self.game_athletes = {
+            (game, athlete): models.GameAthlete.objects.create(game=self.schedules[game].game, athlete=self.athletes[athlete])
+            for game, athlete in [(0, 0), (0, 1), (1, 0), (1, 2)]
+        }
+
+    def box_score(self, *lines):
+        return {'PlayerGames': [{'PlayerID': api_id, 'FantasyPoints': points} for api_id, points in lines]}
+
+    def scores(self):
+        return {
+            key: models.GameAthleteStat.objects.filter(game_athlete=game_athlete).values_list('fantasy_score', flat=True).first()
+            for key, game_athlete in self.game_athletes.items()
+        }
+
+    def test_only_the_players_of_each_box_score_are_scored(self):
+        created, updated = box_scores.save_box_scores([
+            (self.schedules[0], self.box_score((0, 10.5), (1, 3))),
+            (self.schedules[1], self.box_score((2, 7))),
+        ], [])
+
+        self.assertEqual((len(created), len(updated)), (3, 0))
+        self.assertEqual(self.scores(), {(0, 0): Decimal('10.50'), (0, 1): Decimal('3.00'), (1, 0): None, (1, 2): Decimal('7.00')})
+
+        created, updated = box_scores.save_box_scores([(self.schedules[1], self.box_score((0, 2), (2, 8)))], [])
+        self.assertEqual((len(created), len(updated)), (1, 1))
+        self.assertEqual(self.scores(), {(0, 0): Decimal('10.50'), (0, 1): Decimal('3.00'), (1, 0): Decimal('2.00'), (1, 2): Decimal('8.00')})
+
+    def test_box_scores_without_players(self):
+        self.assertEqual(box_scores.save_box_scores([(self.schedules[0], {'PlayerGames': None})], []), ([], []))
+
+
+class SyncJobRetentionTests(TestCase):
+
+    def test_prune_deletes_old_finished_jobs(self):
+        now = timezone.now()
+        old = now - timedelta(days=settings.FANTASY_SYNC['RETENTION_DAYS'] + 1)
+        jobs = {
+            'old': models.SyncJob.objects.create(kind=ingest.Kind.TEAMS, status=ingest.Status.SUCCEEDED, finished_at=old),
+            'old_failed': models.SyncJob.objects.create(kind=ingest.Kind.TEAMS, status=ingest.Status.FAILED, finished_at=old),
+            'recent': models.SyncJob.objects.create(kind=ingest.Kind.TEAMS, status=ingest.Status.SUCCEEDED, finished_at=now),
+            'queued': models.SyncJob.objects.create(kind=ingest.Kind.PLAYERS),
+        }
+
+        self.assertEqual(ingest.prune(), 2)
+        self.assertEqual(
+            set(models.SyncJob.objects.values_list('pk', flat=True)),
+            {jobs['recent'].pk, jobs['queued'].pk}
+        )
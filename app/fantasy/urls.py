@@ -9,6 +9,8 @@ router.register(r'team', views.TeamViewSet)
 router.register(r'athlete/api', views.AthleteAPIViewSet)
 router.register(r'athlete', views.AthleteViewSet)
 router.register(r'game', views.GameViewSet)
+router.register(r'changes', views.ChangeLogViewSet)
+router.register(r'jobs', views.SyncJobViewSet)
 
 urlpatterns = [
   url(r'', include(router.urls)),
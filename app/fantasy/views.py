@@ -2,14 +2,14 @@ from django.shortcuts import render
 from django.conf import settings
 from rest_framework import status, generics, viewsets, mixins
 from rest_framework.response import Response
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 
 from drf_yasg.utils import swagger_auto_schema
 
+from fantasy import ingest
 from fantasy import models
-from fantasy import requests
+from fantasy import rate_limit
 from fantasy import serializers
-from core import utils
 
 #TODO: Define permissions for create and update actions
 class TeamViewSet(mixins.CreateModelMixin, mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
@@ -19,23 +19,13 @@ class TeamViewSet(mixins.CreateModelMixin, mixins.ListModelMixin, mixins.Retriev
     permission_classes = [AllowAny]
 
     
-    @swagger_auto_schema(operation_description="Retrieves all NBA team data and saves it into the database.")
+    @swagger_auto_schema(
+        operation_description="Queues a sync of all NBA team data. Returns the sync job, run by manage.py sync_fantasy.",
+        responses={202: serializers.SyncJobSerializer}
+    )
     def create(self, request, *args, **kwargs):
-        response = requests.get('scores/json/teams')
-        if response['status'] == settings.RESPONSE['STATUS_OK']:
-            team_data = utils.parse_team_list_data(response['response'])
-            serializer = self.get_serializer(data=team_data, many=True)
-            if serializer.is_valid():
-                serializer.save()
-                return Response(serializer.data, status=status.HTTP_201_CREATED)
-            else:
-                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-        else:
-            content = {
-                "message": "Failed to fetch data from Stats Perform API",
-                "response": response['response']
-            }
-            return Response(content, status=status.HTTP_400_BAD_REQUEST)
+        job = ingest.enqueue(models.SyncJob.Kind.TEAMS)
+        return Response(serializers.SyncJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
 
 class AthleteAPIViewSet(mixins.CreateModelMixin, viewsets.GenericViewSet):
     """Manage athletes in the database"""
@@ -44,24 +34,12 @@ class AthleteAPIViewSet(mixins.CreateModelMixin, viewsets.GenericViewSet):
     permission_classes = [AllowAny]
     
     @swagger_auto_schema(
-        operation_description= "Creates an athlete instance in the database with the data from stats perform. The input could either be the name of the athlete or its corresponding id from stats perform."
+        operation_description="Queues a sync of every athlete from the SportsData Players feed. Returns the sync job, run by manage.py sync_fantasy.",
+        responses={202: serializers.SyncJobSerializer}
     )
     def create(self, request, *args, **kwargs):
-        response = requests.get('scores/json/Players')
-        if response['status'] == settings.RESPONSE['STATUS_OK']:
-            athlete_data = utils.parse_athlete_list_data(response['response'])
-            serializer = serializers.AthleteAPISerializer(data=athlete_data, many=True)
-            if serializer.is_valid():
-                serializer.save()
-                return Response(serializer.data, status=status.HTTP_201_CREATED)
-            else:
-                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-        else:
-            content = {
-                "message": "Failed to fetch data from Stats Perform API",
-                "response": response['response']
-            }
-            return Response(content, status=status.HTTP_400_BAD_REQUEST)
+        job = ingest.enqueue(models.SyncJob.Kind.PLAYERS)
+        return Response(serializers.SyncJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
 
     #TODO: Partial update for athlete data
 
@@ -71,6 +49,41 @@ class AthleteViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.
     serializer_class = serializers.AthleteSerializer
     permission_classes = [AllowAny]
 
+class ChangeLogViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
+    """Athletes and teams created or changed by syncs, oldest first"""
+    queryset = models.ChangeLog.objects.all()
+    serializer_class = serializers.ChangeLogSerializer
+    permission_classes = [AllowAny]
+
+    @swagger_auto_schema(operation_description="Lists change log entries after the `since` id, optionally for one `model` (athlete or team).")
+    def list(self, request, *args, **kwargs):
+        queryset = self.get_queryset()
+        try:
+            queryset = queryset.filter(id__gt=int(request.query_params.get('since', 0)))
+        except ValueError:
+            return Response({'since': 'A valid integer is required.'}, status=status.HTTP_400_BAD_REQUEST)
+        if request.query_params.get('model'):
+            queryset = queryset.filter(model=request.query_params['model'])
+        changes = list(queryset.order_by('id')[:settings.FANTASY_INGEST['CHANGES_PAGE_SIZE']])
+        serializer = self.get_serializer(changes, many=True)
+        response = Response(serializer.data, status=status.HTTP_200_OK)
+        if len(changes) == settings.FANTASY_INGEST['CHANGES_PAGE_SIZE']:
+            response['X-Next-Cursor'] = changes[-1].id
+        return response
+
+class SyncJobViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """Status of queued and finished provider syncs"""
+    queryset = models.SyncJob.objects.all()
+    serializer_class = serializers.SyncJobSerializer
+    permission_classes = [AllowAny]
+
+class RateLimitView(generics.GenericAPIView):
+    """Provider request budget left on this host"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(rate_limit.budget(), status=status.HTTP_200_OK)
+
 class GameViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
     """Manage games in the database"""
     queryset = models.Game.objects.all()